@@ -0,0 +1,156 @@
+from collections import namedtuple
+
+import numpy as np
+
+from bars import from_day_number
+
+# Portfolio analytics over daily series, computed with NumPy array operations
+# (one row per symbol, one column per day) rather than a Python loop per day.
+
+TRADING_DAYS = 252
+
+PortfolioSeries = namedtuple("PortfolioSeries", [
+    "days",       # Day numbers (see bars.day_number)
+    "symbols",    # Row labels of the matrices below
+    "positions",  # Shares held at the end of each day
+    "prices",     # Close of each day (trade prices fill gaps in the history)
+    "holdings",   # Market value of each position at the end of each day
+    "flows",      # Net cash put into each symbol each day (buys positive, sales negative)
+    "deposits",   # Cash added to the account each day
+    "buys",       # Cash spent buying stocks each day
+    "value",      # Market value of all holdings at the end of each day
+    "cash",       # Cash at the end of each day
+    "equity",     # cash + value
+])
+
+
+def portfolio_series(trades, history, starting_cash, deposits=None):
+    """Build daily position and equity series from trades and daily closes.
+
+    trades is a dict of equal length arrays: date (day numbers), symbol,
+    shares (negative for sales) and price. history maps symbol -> dict
+    of date and close arrays, as returned by helpers.get_history.
+    starting_cash is the cash before the first trade, not counting
+    deposits (a dict of date and amount arrays), which are added on their
+    day (those before the first trade on the first day).
+    """
+
+    symbols, row = np.unique(np.asarray(trades["symbol"]), return_inverse=True)
+    trade_days = np.asarray(trades["date"], dtype="int64")
+    shares = np.asarray(trades["shares"], dtype="float64")
+    trade_prices = np.asarray(trades["price"], dtype="float64")
+    amounts = shares * trade_prices
+
+    # Every day with a trade, deposit or close, from the first trade on (marked in
+    # a calendar spanning the period, which also maps each day to its column)
+    first = trade_days.min()
+    deposit_days = np.maximum(np.asarray(deposits["date"] if deposits else [], dtype="int64"), first)
+    deposit_amounts = np.asarray(deposits["amount"] if deposits else [], dtype="float64")
+    last = max([trade_days.max()] + deposit_days.tolist()
+               + [history[s]["date"][-1] for s in symbols if s in history and len(history[s]["date"])])
+    calendar = np.zeros(last - first + 1, dtype=bool)
+    calendar[trade_days - first] = True
+    calendar[deposit_days - first] = True
+    for symbol in symbols:
+        if symbol in history:
+            bar_days = history[symbol]["date"]
+            calendar[bar_days[bar_days >= first] - first] = True
+
+    days = np.flatnonzero(calendar) + first
+    column_of = np.cumsum(calendar) - 1
+    column = column_of[trade_days - first]
+    shape = (len(symbols), len(days))
+
+    # Net shares and cash per symbol and day (summing trades on the same day)
+    cell = row * len(days) + column
+    traded = np.bincount(cell, weights=shares, minlength=shape[0] * shape[1]).reshape(shape)
+    flows = np.bincount(cell, weights=amounts, minlength=shape[0] * shape[1]).reshape(shape)
+    buys = np.bincount(column, weights=np.maximum(amounts, 0), minlength=shape[1])
+    positions = np.cumsum(traded, axis=1)
+
+    # Closes where the history has them, trade prices otherwise
+    prices = np.zeros(shape)
+    known = np.zeros(shape, dtype=bool)
+    prices[row, column] = trade_prices
+    known[row, column] = True
+    for index, symbol in enumerate(symbols):
+        bars = history.get(symbol)
+        if bars is not None and len(bars["date"]):
+            keep = bars["date"] >= first
+            columns = column_of[bars["date"][keep] - first]
+            prices[index, columns] = bars["close"][keep]
+            known[index, columns] = True
+
+    # Carry the last known price forward over days without one, for the symbols
+    # with gaps (before a symbol's first price nothing is held, so 0 is harmless)
+    gaps = np.flatnonzero(~known.all(axis=1))
+    if len(gaps):
+        last_known = np.where(known[gaps], np.arange(len(days)), 0)
+        np.maximum.accumulate(last_known, axis=1, out=last_known)
+        prices[gaps] = np.take_along_axis(prices[gaps], last_known, axis=1)
+
+    holdings = positions * prices
+    value = holdings.sum(axis=0)
+    added = np.bincount(column_of[deposit_days - first], weights=deposit_amounts, minlength=len(days))
+    cash = starting_cash + np.cumsum(added) - np.cumsum(flows.sum(axis=0))
+
+    return PortfolioSeries(days, symbols, positions, prices, holdings, flows, added, buys, value, cash, cash + value)
+
+
+def daily_returns(series):
+    """Daily return of the invested holdings, and each symbol's contribution to it.
+
+    Trades are treated as external cash flows, buys at the start of the day
+    and sales at the end (so the day's capital is the previous value plus
+    purchases). Idle cash and deposits don't count, so the returns are net
+    of money added to the account. Contributions add up to the daily return.
+    """
+
+    pnl = np.diff(series.holdings, axis=1, prepend=0) - series.flows
+    capital = np.concatenate([[0], series.value[:-1]]) + series.buys
+
+    scale = np.divide(1, capital, out=np.zeros_like(capital), where=capital > 0)
+    contributions = pnl * scale
+    return contributions.sum(axis=0), contributions, pnl
+
+
+def performance(series, risk_free_rate=0.0):
+    """Time-weighted return, volatility, max drawdown, Sharpe ratio and per-symbol contribution."""
+
+    returns, contributions, pnl = daily_returns(series)
+
+    growth = np.cumprod(1 + returns)
+    drawdowns = growth / np.maximum.accumulate(growth) - 1
+    twr = growth[-1] - 1
+
+    deviation = returns.std(ddof=1) if len(returns) > 1 else 0.0
+    volatility = deviation * np.sqrt(TRADING_DAYS)
+    sharpe = None
+    if deviation > 0:
+        sharpe = float((returns.mean() - risk_free_rate / TRADING_DAYS) / deviation * np.sqrt(TRADING_DAYS))
+
+    symbols = [
+        {
+            "symbol": str(symbol),
+            "contribution": float(contribution),
+            "gain_loss": round(float(gain), 2),
+            "value": round(float(value), 2),
+        }
+        for symbol, contribution, gain, value in zip(
+            series.symbols, contributions.sum(axis=1), pnl.sum(axis=1), series.holdings[:, -1])
+    ]
+    symbols.sort(key=lambda item: item["contribution"], reverse=True)
+
+    return {
+        "start": from_day_number(series.days[0]).isoformat(),
+        "end": from_day_number(series.days[-1]).isoformat(),
+        "days": len(series.days),
+        "equity": round(float(series.equity[-1]), 2),
+        "time_weighted_return": float(twr),
+        "annualized_return": float((1 + twr) ** (TRADING_DAYS / len(returns)) - 1) if twr > -1 else -1.0,
+        "volatility": float(volatility),
+        "sharpe_ratio": sharpe,
+        "max_drawdown": float(drawdowns.min()),
+        "max_drawdown_date": from_day_number(series.days[np.argmin(drawdowns)]).isoformat(),
+        "symbols": symbols,
+    }
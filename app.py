@@ -1,14 +1,27 @@
 import os
-from flask import Flask, flash, redirect, render_template, request, session
+from flask import Flask, Response, flash, get_template_attribute, has_request_context, jsonify, redirect, render_template, request, session, stream_with_context
 from flask_sqlalchemy import SQLAlchemy as _BaseSQLAlchemy
 from flask_migrate import Migrate
 from werkzeug.exceptions import default_exceptions, HTTPException, InternalServerError
+from werkzeug.http import is_resource_modified
 from werkzeug.security import check_password_hash, generate_password_hash
-from markupsafe import escape
+from markupsafe import Markup, escape
+import csv
+import hashlib
+import io
+import json
 import re
-from datetime import datetime
+import sys
+import time
+from concurrent.futures import TimeoutError
+from datetime import datetime, timedelta
 import warnings
 
+import click
+import numpy as np
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import selectinload
+
 from flask_login import (
     login_user,
     LoginManager,
@@ -17,7 +30,12 @@ from flask_login import (
     login_required,
 )
 
-from helpers import lookup, get_news, usd
+from helpers import lookup, lookup_many, get_history, get_news, usd, market_data, quote_breaker
+from cache import fragment_cache, last_prices, news_cache, price_snapshot, quote_cache
+from bars import bar_store, day_number, from_day_number
+from analytics import performance, portfolio_series
+from refresher import price_refresher
+from instrumentation import metrics, sql_counter
 
 # Subclass SQLAlchemy to fix psycopg2 operational error on deployment
 # https://stackoverflow.com/questions/55457069/how-to-fix-operationalerror-psycopg2-operationalerror-server-closed-the-conn
@@ -39,6 +57,24 @@ migrate = Migrate(app, db)
 # Custom filter
 app.jinja_env.filters["usd"] = usd
 
+# Pooled HTTP client for the stock and news APIs
+market_data.init_app(app)
+
+# Quote cache in front of the stock API (shared between workers if configured)
+quote_cache.init_app(app)
+news_cache.init_app(app)
+fragment_cache.init_app(app)
+
+# Local store of daily price history
+bar_store.init_app(app)
+
+# Fail fast while the stock API is down, showing last known prices instead
+quote_breaker.init_app(app)
+last_prices.init_app(app)
+
+# Optional background refresher keeping prices of held stocks current
+price_refresher.init_app(app)
+
 # Flask-Login setup (for sessions)
 login_manager = LoginManager()
 login_manager.session_protection = "strong"
@@ -60,18 +96,77 @@ if not os.environ.get("NEWS_API_KEY"):
 # NEWS_API_KEY = app.config.get("NEWS_API_KEY")
 
 # Import models for SQLAlchemy
-from models import User, Holding, Transaction
+from models import User, Holding, Transaction, Deposit, LeaderboardEntry, PortfolioSnapshot, Order
+from trades import TradeError, execute_basket, execute_buy, execute_sell, run_trade, validate_basket
+from leaderboard import update_leaderboard
+from snapshots import take_snapshots
+from matching import matching_engine
+from backtest import STRATEGIES, Ledger, file_series, merge_bars, run_backtest, store_series, trading_days, write_transactions
+
+# In-memory books of limit and stop orders, filled as prices update
+matching_engine.init_app(app)
+
+# Count SQL statements per request (catches N+1 query regressions)
+sql_counter.init_app(app)
+
+# Latency of requests, stock and news API calls, SQL and templates (at /metrics)
+metrics.init_app(app)
+
+def eager_load(*relationships):
+    """Declare User relationships a route needs, loaded together with the user.
+
+    Place below @login_required so the declaration is visible to load_user.
+    """
+    def decorator(f):
+        f.eager_relationships = relationships
+        return f
+    return decorator
 
 # Set up user loader for Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Load the relationships the current route declared with eager_load up front,
+    # instead of one lazy query each later on
+    relationships = ()
+    if has_request_context() and request.endpoint in app.view_functions:
+        relationships = getattr(app.view_functions[request.endpoint], "eager_relationships", ())
+
+    options = [selectinload(getattr(User, name)) for name in relationships]
+    return User.query.options(*options).get(int(user_id))
 
 # Inject current date and time into routes (for copyright year)
 @app.context_processor
 def inject_now():
     return {'now': datetime.utcnow()}
 
+def page_etag(*parts):
+    """ETag of a page rendered from parts (anything with a stable repr)."""
+
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def revalidated(response, etag, last_modified=None):
+    """Let browsers keep the page, checking with the server (If-None-Match/If-Modified-Since) before each use."""
+
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag, last_modified=None):
+    """Return a 304 response if the browser's copy of the page is still current, None otherwise.
+
+    Pages with flashed messages waiting are always sent in full.
+    """
+
+    if "_flashes" in session or is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return revalidated(Response(status=304), etag, last_modified)
+
+
 @app.route("/")
 def index():
     """Show website home page"""
@@ -309,6 +404,10 @@ def buy():
         if not quote:
             return render_template("buy.html", error="Invalid symbol"), 400
 
+        # Don't trade at a last known price while the stock API is down
+        elif quote.get("stale"):
+            return render_template("buy.html", error="Live price unavailable, please try again later"), 503
+
         # Check if shares entry is numeric
         elif not (request.form.get("shares")).isdigit():
             return render_template("buy.html", error="Invalid entry"), 400
@@ -321,45 +420,14 @@ def buy():
         elif int(request.form.get("shares")) <= 0:
             return render_template("buy.html", error="Share bought must be greater than zero"), 400
 
-        # Check if user has enough money to complete purchase of shares
+        # Deduct cash, update holdings and record transaction in one database transaction
+        # (the cash check happens atomically with the deduction)
         user = current_user
 
-        if quote["price"] * int(request.form.get("shares")) > user.cash:
-            return render_template("buy.html", error="Not enough cash to complete purchase"), 400
-
-        # Record transaction in database
-        new_transaction = Transaction(
-            user_id=user.id,
-            symbol=quote["symbol"],
-            shares=int(request.form.get("shares")),
-            price=quote["price"],
-            timestamp=datetime.now(),
-
-        )
-        db.session.add(new_transaction)
-
-        # Deduct cash from user
-        user.cash -= quote["price"] * int(request.form.get("shares"))
-
-        # Update user's stock holdings (portfolio)
-        # Check if stock is already in holdings
-        found_holding = Holding.query.filter((Holding.user_id == user.id) & (Holding.symbol == new_transaction.symbol)).first()
-
-        # Add stock to holdings if not already owned
-        if found_holding == None:
-            new_holding = Holding(
-                user_id=user.id,
-                symbol=new_transaction.symbol,
-                shares=new_transaction.shares
-            )
-            db.session.add(new_holding)
-
-        # Update stock in holdings if already owned
-        else:
-            found_holding.shares += new_transaction.shares
-
-        # Save all changes to database
-        db.session.commit()
+        try:
+            run_trade(execute_buy, user.id, quote["symbol"], int(request.form.get("shares")), quote["price"])
+        except TradeError as e:
+            return render_template("buy.html", error=str(e)), 400
 
         flash("Purchase completed")
         return redirect("/portfolio")
@@ -377,6 +445,7 @@ def buy_symbol(symbol):
 
 @app.route("/sell", methods=["GET", "POST"])
 @login_required
+@eager_load("holdings")
 def sell():
     """Sell shares of a stock"""
 
@@ -393,6 +462,10 @@ def sell():
         if not quote:
             return render_template("sell.html", error="Invalid symbol"), 400
 
+        # Don't trade at a last known price while the stock API is down
+        elif quote.get("stale"):
+            return render_template("sell.html", error="Live price unavailable, please try again later"), 503
+
         # Check if shares entry is numeric
         elif not (request.form.get("shares")).isdigit():
             return render_template("sell.html", error="Invalid entry"), 400
@@ -402,44 +475,17 @@ def sell():
             return render_template("sell.html", error="Invalid entry"), 400
 
         # Check if shares entry is non-negative
-        elif int(request.form.get("shares")) < 0:
+        elif int(request.form.get("shares")) <= 0:
             return render_template("sell.html", error="share sold must be greater than zero"), 400
 
-        # Query database to find stock in user's holdings
+        # Take shares, add funds and record transaction in one database transaction
+        # (the share check happens atomically with the sale)
         user = current_user
-        holding = Holding.query.filter((Holding.user_id==user.id) & (Holding.symbol==quote["symbol"])).first()
-
-        # Check if user owns shares of stock user wants to sell
-        if holding == None:
-            return render_template("sell.html", error="You do not own shares in this company"), 400
-
-        # Check if user owns enough shares user intends to sell
-        elif holding.shares < int(request.form.get("shares")):
-            return render_template("sell.html", error="You do not own that many shares to sell"), 400
-
-        # Record transaction
-        new_transaction = Transaction(
-            user_id=user.id,
-            symbol=quote["symbol"],
-            shares=int(request.form.get("shares")) * (-1),
-            price=quote["price"],
-            timestamp=datetime.now()
-        )
-        db.session.add(new_transaction)
-
-        # Add funds from sale to user's account
-        user.cash += (int(request.form.get("shares")) * quote["price"])
-
-        # If selling all stock, delete from holdings
-        if holding.shares == new_transaction.shares:
-            db.session.delete(holding)
-
-        # Otherwise, update the holding for the stock in the database
-        else:
-            holding.shares += new_transaction.shares # += because shares is negative due to sale
 
-        # Save all changes to database
-        db.session.commit()
+        try:
+            run_trade(execute_sell, user.id, quote["symbol"], int(request.form.get("shares")), quote["price"])
+        except TradeError as e:
+            return render_template("sell.html", stocks=user.holdings, error=str(e)), 400
 
         flash("Sale completed")
         return redirect("/portfolio")
@@ -454,6 +500,7 @@ def sell():
 
 @app.route("/sell/<string:symbol>")
 @login_required
+@eager_load("holdings")
 def sell_symbol(symbol):
     user = current_user
     stocks = user.holdings
@@ -461,6 +508,180 @@ def sell_symbol(symbol):
     return render_template("sell.html", stocks=stocks, symbol=escape(symbol))
 
 
+@app.route("/orders/basket", methods=["POST"])
+@login_required
+@eager_load("holdings")
+def basket_order():
+    """Buy and sell several stocks in one request (JSON API)
+
+    Expects {"mode": "all_or_nothing" or "best_effort",
+             "orders": [{"symbol": "AAPL", "side": "buy" or "sell", "shares": 10}, ...]}
+    All stocks are priced in one batch and the basket is applied with one commit.
+    """
+
+    data = request.get_json(silent=True)
+
+    # Validate basket structure
+    if not isinstance(data, dict) or not isinstance(data.get("orders"), list) or not data["orders"]:
+        return jsonify(error="Must provide a list of orders"), 400
+
+    mode = data.get("mode", "all_or_nothing")
+    if mode not in ("all_or_nothing", "best_effort"):
+        return jsonify(error="Mode must be all_or_nothing or best_effort"), 400
+
+    if len(data["orders"]) > app.config["BASKET_MAX_ORDERS"]:
+        return jsonify(error=f"Basket can have at most {app.config['BASKET_MAX_ORDERS']} orders"), 400
+
+    # Validate each order the same way as the buy and sell forms
+    legs = []
+    for i, order in enumerate(data["orders"]):
+        if not isinstance(order, dict):
+            return jsonify(error=f"Order {i}: must be an object"), 400
+
+        symbol = str(order.get("symbol", ""))
+        shares = str(order.get("shares", ""))
+
+        if not (0 < len(symbol) <= 5 and symbol.isalpha()):
+            return jsonify(error=f"Order {i}: invalid symbol"), 400
+        if order.get("side") not in ("buy", "sell"):
+            return jsonify(error=f"Order {i}: side must be buy or sell"), 400
+        if not shares.isdigit() or int(shares) <= 0:
+            return jsonify(error=f"Order {i}: shares must be a whole number greater than zero"), 400
+
+        legs.append({"symbol": symbol.upper(), "side": order["side"], "shares": int(shares), "price": None})
+
+    # Price all stocks in the basket at once
+    quotes = lookup_many([leg["symbol"] for leg in legs], timeout=app.config["QUOTE_BATCH_TIMEOUT"])
+
+    errors = [None] * len(legs)
+    for i, leg in enumerate(legs):
+        if quotes.get(leg["symbol"]) is None:
+            errors[i] = "Invalid symbol"
+        elif quotes[leg["symbol"]].get("stale"):
+            errors[i] = "Live price unavailable, please try again later"
+        else:
+            leg["price"] = quotes[leg["symbol"]]["price"]
+
+    # Check priced orders against cash and holdings before touching the database
+    user = current_user
+    priced = [i for i, leg in enumerate(legs) if errors[i] is None]
+    checks = validate_basket(user.cash, {holding.symbol: holding.shares for holding in user.holdings}, [legs[i] for i in priced])
+    for i, error in zip(priced, checks):
+        errors[i] = error
+
+    # Apply the valid orders in one database transaction
+    if mode == "best_effort" or not any(errors):
+        valid = [i for i, leg in enumerate(legs) if errors[i] is None]
+        try:
+            results = run_trade(execute_basket, user.id, [legs[i] for i in valid], mode == "best_effort")
+        except TradeError as e:
+            # Holdings or cash changed since the check (all or nothing)
+            for i in valid:
+                errors[i] = str(e)
+        else:
+            for i, error in zip(valid, results):
+                errors[i] = error
+
+    # All or nothing: nothing was applied if any order was rejected
+    else:
+        for i, error in enumerate(errors):
+            if error is None:
+                errors[i] = "Not placed because another order in the basket was rejected"
+
+    orders = []
+    for leg, error in zip(legs, errors):
+        leg["status"] = "rejected" if error else "filled"
+        leg["error"] = error
+        orders.append(leg)
+
+    filled = sum(1 for order in orders if order["status"] == "filled")
+    if filled == len(orders):
+        status = "filled"
+    elif filled:
+        status = "partial"
+    else:
+        status = "rejected"
+
+    return jsonify(status=status, orders=orders), 200 if filled else 400
+
+
+@app.route("/orders", methods=["GET", "POST"])
+@login_required
+def orders():
+    """Place limit and stop orders, and list the user's orders"""
+
+    user = current_user
+
+    # User reached route via POST (as by submitting a form via POST)
+    if request.method == "POST":
+        symbol = request.form.get("symbol", "")
+        shares = request.form.get("shares", "")
+
+        # Validate length and alphabetical nature of symbol string
+        if not (0 < len(symbol) <= 5 and symbol.isalpha()):
+            error = "Invalid symbol"
+
+        elif request.form.get("side") not in ("buy", "sell") or request.form.get("kind") not in ("limit", "stop"):
+            error = "Invalid order type"
+
+        elif not shares.isdigit() or int(shares) <= 0:
+            error = "Shares must be a whole number greater than zero"
+
+        else:
+            try:
+                price = round(float(request.form.get("price", "")), 2)
+            except ValueError:
+                price = 0
+            error = None if 0 < price < float("inf") else "Price must be greater than zero"
+
+        # Check the symbol exists (a last known price will do, nothing trades yet)
+        if error is None and not lookup(symbol):
+            error = "Invalid symbol"
+
+        if error is None and Order.query.filter((Order.user_id == user.id) & (Order.status == "open")).count() >= app.config["ORDERS_MAX_OPEN"]:
+            error = f"You can have at most {app.config['ORDERS_MAX_OPEN']} open orders"
+
+        if error is None:
+            order = Order(user_id=user.id, symbol=symbol.upper(), side=request.form.get("side"), kind=request.form.get("kind"),
+                          shares=int(shares), price=price)
+            db.session.add(order)
+            db.session.commit()
+            matching_engine.add(order)
+
+            flash("Order placed")
+            return redirect("/orders")
+
+    else:
+        error = None
+
+    # Newest orders first (open and closed)
+    user_orders = Order.query.filter(Order.user_id == user.id).order_by(Order.created_at.desc(), Order.id.desc()) \
+        .limit(app.config["HISTORY_PAGE_SIZE"]).all()
+
+    return render_template("orders.html", orders=user_orders, symbol=escape(request.args.get("symbol", "")), error=error), 400 if error else 200
+
+
+@app.route("/orders/<int:order_id>/cancel", methods=["POST"])
+@login_required
+def cancel_order(order_id):
+    """Cancel an open order"""
+
+    user = current_user
+
+    # Only if still open (it may have just been filled)
+    cancelled = Order.query.filter((Order.id == order_id) & (Order.user_id == user.id) & (Order.status == "open")) \
+        .update({Order.status: "cancelled"}, synchronize_session=False)
+    db.session.commit()
+
+    if cancelled:
+        matching_engine.remove(db.session.get(Order, order_id))
+        flash("Order cancelled")
+    else:
+        flash("Order is no longer open")
+
+    return redirect("/orders")
+
+
 @app.route("/quote", methods=["POST"])
 def quote():
     """Get stock quote via form submission"""
@@ -487,49 +708,81 @@ def quote_symbol(stock_symbol):
     if not (len(symbol) <= 5 and symbol.isalpha()):
         return render_template("index.html", error="Invalid symbol"), 400
 
-    quote = lookup(symbol)
-
-    if not quote:
-        return render_template("index.html", error="Invalid symbol"), 400
+    # The quote header and news are the same for every viewer, so they're
+    # rendered once per stock and cached. The quote itself always comes from
+    # lookup (quote cache and price snapshot), the header is only reused while
+    # it's unchanged; news is fetched again once its part expires.
+    key = symbol.upper()
+    news = fragment_cache.get("news:" + key)
 
-    news_items = get_news(symbol)
+    # Fetch quote and news at the same time (page waits for the slower, not both)
+    started = time.monotonic()
+    quote_future = market_data.executor.submit(lookup, str(symbol))
+    if news is None:
+        news_future = market_data.executor.submit(get_news, str(symbol))
 
-    # Check if user is logged in, then check if they own the stock
+    # Check if user is logged in, then check if they own the stock (while the APIs respond)
     logged_in = False
-    user_holding = None
+    holding = None
     if not current_user.is_anonymous:
         logged_in = True
         user = current_user
-        holding = Holding.query.filter((Holding.user_id == user.id) & (Holding.symbol == quote["symbol"])).first()
+        holding = Holding.query.filter((Holding.user_id == user.id) & (Holding.symbol == symbol.upper())).first()
+
+    try:
+        quote = quote_future.result(timeout=app.config["QUOTE_BATCH_TIMEOUT"])
+    except TimeoutError:
+        # Slow stock API, not an unknown symbol
+        return render_template("index.html", error="Quote temporarily unavailable, please try again later"), 503
+
+    if not quote:
+        return render_template("index.html", error="Invalid symbol"), 400
 
-        if holding is not None:
-            value = holding.shares * float(quote["price"])
-            cost = 0
+    header = fragment_cache.get("quote:" + key, data=quote)
+    if header is None:
+        header = fragment_cache.set("quote:" + key, {"header": str(get_template_attribute("quote_fragments.html", "header")(quote))}, quote)
+
+    if news is None:
+        # News is optional: show none if it misses its deadline
+        try:
+            news_items = news_future.result(timeout=max(app.config["NEWS_TIMEOUT"] - (time.monotonic() - started), 0))
+        except TimeoutError:
+            news_items = None
+
+        # Kept even without news (like a missing key or the News API's daily limit),
+        # so a failing News API isn't waited on by every view
+        news = fragment_cache.set("news:" + key, {"news": str(get_template_attribute("quote_fragments.html", "news")(news_items or []))})
+
+    # Same shared parts, viewer and holding: the browser's copy is current.
+    # Anonymous pages only change with the shared parts, so they can go by date too.
+    etag = page_etag(header["etag"], news["etag"], logged_in and current_user.id, holding and (holding.shares, holding.total_cost), datetime.utcnow().year)
+    last_modified = None if logged_in else max(header["rendered_at"], news["rendered_at"])
+    response = not_modified(etag, last_modified)
+    if response is not None:
+        return response
 
-            # Calculate cost of all portfolio transactions
-            # If sold stock, will subtract since shares in transaction will be negative
-            transactions = Transaction.query.filter((Transaction.user_id == user.id) & (Transaction.symbol == quote["symbol"])).all()
+    user_holding = None
+    if holding is not None:
+        value = holding.shares * float(quote["price"])
 
-            # Check if there are multiple transactions (have to check for single item when using filter)
-            if type(transactions) is list:
-                for transaction in transactions:
-                    cost += transaction.shares * transaction.price
-            # Otherwise, if transactions is not None, but not a list, must only be sinlge entry
-            elif transactions:
-                cost = transactions.shares * transactions.price
+        # Net cost of all transactions for this stock (kept on the holding)
+        cost = holding.total_cost
 
-            user_holding = {
-                "shares": holding.shares,
-                "cost": cost,
-                "value": value,
-                "gain_loss": value - cost
-            }
+        user_holding = {
+            "shares": holding.shares,
+            "cost": cost,
+            "value": value,
+            "gain_loss": value - cost
+        }
 
-    return render_template("quote.html", quote=quote, news_items=news_items, logged_in=logged_in, user_holding=user_holding)
+    fragment = {name: Markup(html) for name, html in {**header["parts"], **news["parts"]}.items()}
+    response = app.make_response(render_template("quote.html", quote=quote, fragment=fragment, logged_in=logged_in, user_holding=user_holding))
+    return revalidated(response, etag, last_modified)
 
 
 @app.route("/portfolio")
 @login_required
+@eager_load("holdings")
 def portfolio():
     """Show portfolio of user's stock holdings"""
 
@@ -537,60 +790,237 @@ def portfolio():
     user = current_user
     holdings = user.holdings
     stocks = [] # List of stock dicts
-    transactions = user.transactions
 
-    portfolio_cost = 0
     portfolio_value = 0
 
-    # Get current prices for stocks using API
+    # Get current prices for all stocks at once using API
+    quotes = lookup_many([holding.symbol for holding in holdings], timeout=app.config["QUOTE_BATCH_TIMEOUT"])
+    prices_missing = False
+    prices_stale = False
+
     for holding in holdings:
-        quote = lookup(holding.symbol)
+        # Emptied positions aren't shown (their cost still counts below)
+        if not holding.shares:
+            continue
+
+        quote = quotes.get(holding.symbol.upper())
         stock = {}
         stock["symbol"] = holding.symbol
-        stock["name"] = quote["name"]
-        stock["price"] = float(quote["price"])
         stock["shares"] = int(holding.shares)
-        stock["total_value"] = float(quote["price"]) * int(holding.shares)
 
-        # Calculate cost of shares (total price paid)
-        cost = 0
-        for transaction in transactions:
-            if transaction.symbol == stock["symbol"]:
-                cost += transaction.shares * transaction.price # Sold shares will be negative
+        # Show the holding without a price if the API failed or timed out
+        if quote is None:
+            stock["name"] = holding.symbol
+            stock["price"] = None
+            stock["total_value"] = None
+            prices_missing = True
+        else:
+            stock["name"] = quote["name"]
+            stock["price"] = float(quote["price"])
+            stock["total_value"] = float(quote["price"]) * int(holding.shares)
+            portfolio_value += stock["total_value"]
+
+            # Last known price while the stock API is down
+            stock["stale"] = bool(quote.get("stale"))
+            prices_stale = prices_stale or stock["stale"]
 
+        # Cost of shares (total price paid, sold shares subtract)
+        cost = holding.total_cost
         stock["cost"] = cost / holding.shares
         stock["total_cost"] = cost
         stocks.append(stock) # Append stock dict to list of stocks
-        portfolio_value += stock["total_value"]
 
-    # Calculate cost of all portfolio transactions
-    # Don't need to check for only single transaction since SQLAlchemy
-    # with relationship returns InstrumentedList
-    # If sold stock, will subtract since shares in transaction will be negative
-    for transaction in transactions:
-        portfolio_cost += transaction.shares * transaction.price
+    # Cost of all portfolio transactions, including stocks no longer held
+    # (their net cost is the negative of the realized gain)
+    portfolio_cost = sum(holding.total_cost for holding in holdings) - user.realized_gain
 
     # Format current user's portfolio info
     user_info = {
         "cash": user.cash,
         "portfolio_cost": portfolio_cost,
         "portfolio_value": portfolio_value,
-        "gain_loss": portfolio_value - portfolio_cost
+        "gain_loss": portfolio_value - portfolio_cost,
+        "prices_missing": prices_missing,
+        "prices_stale": prices_stale
     }
 
-    return render_template("portfolio.html", stocks=stocks, user_info=user_info)
+    # Nothing changed since the browser's copy (same holdings, prices and cash): skip rendering
+    etag = page_etag(user.id, stocks, user_info, datetime.utcnow().year)
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
+    return revalidated(app.make_response(render_template("portfolio.html", stocks=stocks, user_info=user_info)), etag)
+
+
+@app.route("/portfolio/analytics")
+@app.route("/portfolio/analytics.<any(json):file_format>")
+@login_required
+def portfolio_analytics(file_format=None):
+    """Show portfolio performance since the user's first trade (page or JSON)"""
+
+    user = current_user
+
+    # All of the user's trades as columns (no ORM objects)
+    rows = db.session.query(Transaction.symbol, Transaction.shares, Transaction.price, Transaction.timestamp) \
+        .filter(Transaction.user_id == user.id).all()
+
+    if not rows:
+        if file_format == "json":
+            return jsonify(error="No transactions yet"), 404
+        return render_template("analytics.html", stats=None)
+
+    symbols, shares, prices, timestamps = zip(*rows)
+    trades = {
+        "symbol": [symbol.upper() for symbol in symbols],
+        "shares": np.array(shares, dtype="float64"),
+        "price": np.array(prices, dtype="float64"),
+        "date": np.array([day_number(timestamp.date()) for timestamp in timestamps]),
+    }
+
+    # Daily closes since the first trade for every stock traded, fetched concurrently
+    days = (datetime.now().date() - min(timestamps).date()).days + 1
+    traded = sorted(set(trades["symbol"]))
+    history = dict(zip(traded, market_data.executor.map(lambda symbol: get_history(symbol, days), traded)))
+
+    # Cash added after the account was opened, applied on the day it came in
+    deposit_rows = db.session.query(Deposit.amount, Deposit.timestamp).filter(Deposit.user_id == user.id).all()
+    deposits = {
+        "amount": np.array([amount for amount, _ in deposit_rows], dtype="float64"),
+        "date": np.array([day_number(timestamp.date()) for _, timestamp in deposit_rows], dtype="int64"),
+    }
+
+    # Cash before the first trade and any deposits (sold shares are negative)
+    starting_cash = user.cash + float(np.dot(trades["shares"], trades["price"])) - float(deposits["amount"].sum())
+
+    series = portfolio_series(trades, history, starting_cash, deposits)
+    stats = performance(series, app.config["ANALYTICS_RISK_FREE_RATE"])
+
+    if file_format == "json":
+        stats["series"] = {
+            "date": [from_day_number(day).isoformat() for day in series.days],
+            "value": series.value.round(2).tolist(),
+            "cash": series.cash.round(2).tolist(),
+            "equity": series.equity.round(2).tolist(),
+        }
+        return jsonify(stats)
+
+    return render_template("analytics.html", stats=stats)
+
+
+@app.route("/portfolio/snapshots.json")
+@login_required
+def portfolio_snapshots():
+    """Daily end of day values of the user's portfolio (JSON, for charts)"""
+
+    days = request.args.get("days", "365")
+    if not days.isdigit():
+        return jsonify(error="days must be a whole number"), 400
+    since = datetime.now().date() - timedelta(days=int(days))
+
+    # Range read on the (user_id, date) index
+    rows = db.session.query(PortfolioSnapshot.date, PortfolioSnapshot.cash, PortfolioSnapshot.holdings_value, PortfolioSnapshot.cost) \
+        .filter((PortfolioSnapshot.user_id == current_user.id) & (PortfolioSnapshot.date >= since)) \
+        .order_by(PortfolioSnapshot.date)
+
+    snapshots = [
+        {
+            "date": day.isoformat(),
+            "cash": round(cash, 2),
+            "holdings_value": round(holdings_value, 2),
+            "total_value": round(cash + holdings_value, 2),
+            "cost": round(cost, 2),
+            "gain_loss": round(holdings_value - cost, 2),
+        }
+        for day, cash, holdings_value, cost in rows
+    ]
+    return jsonify(snapshots=snapshots)
 
 
 @app.route("/history")
 @login_required
 def history():
-    """Show history of user's transactions"""
+    """Show history of user's transactions, newest first, one page at a time"""
 
-    # Query database for all transactions made by current user
     user = current_user
-    transactions = user.transactions
+    page_size = app.config["HISTORY_PAGE_SIZE"]
+
+    # Keyset pagination: the cursor is the (timestamp, id) of the last row on the previous page
+    query = Transaction.query.filter(Transaction.user_id == user.id)
+
+    cursor = request.args.get("before")
+    if cursor:
+        try:
+            timestamp, transaction_id = cursor.rsplit("_", 1)
+            query = query.filter(tuple_(Transaction.timestamp, Transaction.id) < (datetime.fromisoformat(timestamp), int(transaction_id)))
+        except ValueError:
+            return render_template("history.html", transactions=[], error="Invalid page"), 400
+
+    # Fetch one extra row to know whether there is an older page
+    transactions = query.order_by(Transaction.timestamp.desc(), Transaction.id.desc()).limit(page_size + 1).all()
+
+    next_cursor = None
+    if len(transactions) > page_size:
+        transactions = transactions[:page_size]
+        last = transactions[-1]
+        next_cursor = f"{last.timestamp.isoformat()}_{last.id}"
 
-    return render_template("history.html", transactions=transactions)
+    return render_template("history.html", transactions=transactions, next_cursor=next_cursor, paged=bool(cursor))
+
+
+@app.route("/history/export.<any(csv, json):file_format>")
+@login_required
+def history_export(file_format):
+    """Download user's full transaction history, streamed row by row"""
+
+    user_id = current_user.id
+    columns = ["symbol", "shares", "price", "timestamp"]
+
+    # Stream rows from the database in batches instead of loading the whole history
+    rows = db.session.query(Transaction.symbol, Transaction.shares, Transaction.price, Transaction.timestamp) \
+        .filter(Transaction.user_id == user_id) \
+        .order_by(Transaction.timestamp, Transaction.id) \
+        .yield_per(1000)
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+
+        for row in rows:
+            writer.writerow([row.symbol, row.shares, row.price, row.timestamp.isoformat()])
+
+            # Flush the buffer every so often rather than per row
+            if buffer.tell() > 8192:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+        yield buffer.getvalue()
+
+    def generate_json():
+        yield "["
+        separator = ""
+        for row in rows:
+            yield separator + json.dumps({
+                "symbol": row.symbol,
+                "shares": row.shares,
+                "price": row.price,
+                "timestamp": row.timestamp.isoformat()
+            })
+            separator = ","
+        yield "]"
+
+    if file_format == "csv":
+        generate, mimetype = generate_csv, "text/csv"
+    else:
+        generate, mimetype = generate_json, "application/json"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=transactions.{file_format}"}
+    )
 
 
 @app.route("/addcash", methods=["GET", "POST"])
@@ -620,6 +1050,7 @@ def addcash():
             return render_template("addcash.html", error="Amount entered would lead the account to have too much cash ($10,000,000 or more). Please enter a lower amount."), 400
 
         user.cash += int(request.form.get("cash"))
+        db.session.add(Deposit(user_id=user.id, amount=int(request.form.get("cash")), timestamp=datetime.now()))
         db.session.commit()
 
         flash("Cash amount added successfully")
@@ -650,16 +1081,13 @@ def reset():
         user = current_user
 
         user.cash = int(request.form.get("cash"))
+        user.realized_gain = 0
 
-        # Iterate through and delete user's holdings
-        holdings = user.holdings
-        for holding in holdings:
-            db.session.delete(holding)
-
-        # Iterate through and delete user's transactions
-        transactions = user.transactions
-        for transaction in transactions:
-            db.session.delete(transaction)
+        # Delete user's holdings and transactions (one statement each)
+        Holding.query.filter(Holding.user_id == user.id).delete(synchronize_session=False)
+        Order.query.filter(Order.user_id == user.id).delete(synchronize_session=False)
+        Transaction.query.filter(Transaction.user_id == user.id).delete(synchronize_session=False)
+        Deposit.query.filter(Deposit.user_id == user.id).delete(synchronize_session=False)
 
         db.session.commit()
 
@@ -671,6 +1099,127 @@ def reset():
         return render_template("reset.html")
 
 
+@app.route("/leaderboard")
+def leaderboard():
+    """Show top users by portfolio value or return (precomputed by flask update-leaderboard)"""
+
+    by = "return" if request.args.get("by") == "return" else "value"
+    rank = LeaderboardEntry.return_rank if by == "return" else LeaderboardEntry.value_rank
+
+    # One indexed read of the materialized ranking
+    entries = LeaderboardEntry.query.order_by(rank, LeaderboardEntry.user_id) \
+        .limit(app.config["LEADERBOARD_SIZE"]).all()
+
+    # Current user's own position, wherever they rank
+    own_entry = None
+    if current_user.is_authenticated:
+        own_entry = db.session.get(LeaderboardEntry, current_user.id)
+
+    return render_template("leaderboard.html", entries=entries, own_entry=own_entry, by=by)
+
+
+@app.route("/cache/stats")
+def cache_stats():
+    """Show quote cache and circuit breaker counters for this worker (for tuning QUOTE_CACHE_TTL)"""
+
+    stats = quote_cache.stats()
+    stats["fragments"] = fragment_cache.stats()
+    stats["snapshot_max_age"] = price_snapshot.max_age
+    stats["quote_breaker"] = quote_breaker.stats()
+    return jsonify(stats)
+
+
+@app.cli.command("check-cost-basis")
+@click.option("--fix", is_flag=True, help="Overwrite stored values that don't match.")
+def check_cost_basis(fix):
+    """Verify stored holding costs and realized gains against a full recompute from transactions."""
+
+    # Net cost per user and stock, straight from the transactions
+    costs = {}
+    for user_id, symbol, cost in db.session.query(Transaction.user_id, Transaction.symbol,
+            func.sum(Transaction.shares * Transaction.price)).group_by(Transaction.user_id, Transaction.symbol):
+        costs[(user_id, symbol)] = cost
+
+    mismatches = 0
+
+    for holding in Holding.query.all():
+        expected = costs.pop((holding.user_id, holding.symbol), 0)
+        if abs(holding.total_cost - expected) > 0.005:
+            mismatches += 1
+            click.echo(f"Holding {holding.id} ({holding.symbol}): stored cost {holding.total_cost:.2f}, expected {expected:.2f}")
+            if fix:
+                holding.total_cost = expected
+
+    # Whatever is left belongs to stocks no longer held
+    closed_costs = {}
+    for (user_id, _), cost in costs.items():
+        closed_costs[user_id] = closed_costs.get(user_id, 0) + cost
+
+    for user in User.query.all():
+        expected = -closed_costs.get(user.id, 0)
+        if abs(user.realized_gain - expected) > 0.005:
+            mismatches += 1
+            click.echo(f"User {user.id}: stored realized gain {user.realized_gain:.2f}, expected {expected:.2f}")
+            if fix:
+                user.realized_gain = expected
+
+    if fix:
+        db.session.commit()
+
+    click.echo(f"{mismatches} mismatches found" + (" and fixed" if fix and mismatches else ""))
+    if mismatches and not fix:
+        sys.exit(1)
+
+
+@app.cli.command("update-leaderboard")
+@click.option("--interval", type=int, default=0, help="Keep updating every INTERVAL seconds.")
+def update_leaderboard_command(interval):
+    """Rank all users by portfolio value and return into the leaderboard table."""
+
+    while True:
+        started = time.time()
+        click.echo(f"Ranked {update_leaderboard(timeout=app.config['QUOTE_BATCH_TIMEOUT'])} users")
+
+        if interval <= 0:
+            break
+        time.sleep(max(interval - (time.time() - started), 1))
+
+
+@app.cli.command("snapshot-portfolios")
+def snapshot_portfolios_command():
+    """Record today's value of every user's portfolio (run once a day after the market closes)."""
+
+    click.echo(f"Wrote {take_snapshots(timeout=app.config['QUOTE_BATCH_TIMEOUT'])} snapshots")
+
+
+@app.cli.command("backtest")
+@click.argument("strategy", type=click.Choice(sorted(STRATEGIES)))
+@click.option("--data", help="Replay data file (CSV or Parquet) to read bars from, instead of the bar store.")
+@click.option("--symbols", help="Comma-separated symbols to read from the bar store (without --data).")
+@click.option("--start", type=click.DateTime(["%Y-%m-%d"]), help="First day to trade.")
+@click.option("--end", type=click.DateTime(["%Y-%m-%d"]), help="Last day to trade.")
+@click.option("--cash", type=float, default=10000.0, show_default=True, help="Starting cash.")
+@click.option("--output", type=click.File("w"), default="-", help="File to write the transactions to (stdout by default).")
+def backtest_command(strategy, data, symbols, start, end, cash, output):
+    """Run STRATEGY over historical daily bars, writing its transactions as CSV (as the history export)."""
+
+    started = time.time()
+    if data:
+        series = file_series(data)
+    elif symbols:
+        series = store_series(symbols.split(","), bar_store)
+    else:
+        raise click.UsageError("Provide --data or --symbols")
+
+    ledger = Ledger(cash)
+    days = trading_days(merge_bars(series), start and start.date(), end and end.date())
+    count = write_transactions(run_backtest(days, STRATEGIES[strategy](), ledger), output)
+
+    equity = ledger.equity()
+    click.echo(f"{count} transactions ({ledger.rejected} orders rejected) over {ledger.days} days in {time.time() - started:.2f} s: "
+               f"equity {usd(equity)} ({equity / cash - 1:+.2%}), max drawdown {ledger.max_drawdown:.2%}", err=True)
+
+
 # Processes errors
 def errorhandler(e):
     """Handle error"""
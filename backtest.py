@@ -0,0 +1,223 @@
+import csv
+import heapq
+import itertools
+from collections import deque
+from datetime import datetime, time
+
+from bars import COLUMNS, from_day_number
+from providers import Bar, ReplayProvider
+from trades import TradeError, trade_error
+
+# Backtesting: strategies trade against historical daily bars through
+# in-memory ledgers that follow the same rules as the buy and sell routes.
+# Each stage is a generator (bars -> days -> orders -> transactions -> export),
+# so years of bars for hundreds of symbols stream through without touching
+# the database.
+
+
+class Ledger:
+    """In-memory account changed the way trades.execute_buy and execute_sell change a user.
+
+    Keeps cash, holdings (symbol -> [shares, total_cost]), realized gain and
+    the net cost of every symbol ever traded, plus the last close of each
+    symbol for valuing the holdings.
+    """
+
+    def __init__(self, cash):
+        self.starting_cash = cash
+        self.cash = cash
+        self.realized_gain = 0.0
+        self.holdings = {}
+        self.costs = {}
+        self.prices = {}
+        self.peak = cash
+        self.max_drawdown = 0.0
+        self.days = 0
+        self.rejected = 0
+
+    def shares(self, symbol):
+        return self.holdings[symbol][0] if symbol in self.holdings else 0
+
+    def equity(self):
+        return self.cash + sum(shares * self.prices[symbol] for symbol, (shares, _) in self.holdings.items())
+
+    def mark(self, prices):
+        """Take the day's closes (symbol -> price) and track the drawdown of equity."""
+
+        self.prices.update(prices)
+        self.days += 1
+        equity = self.equity()
+        self.peak = max(self.peak, equity)
+        if self.peak > 0:
+            self.max_drawdown = min(self.max_drawdown, equity / self.peak - 1)
+
+    def trade(self, side, symbol, shares, price, timestamp):
+        """Buy or sell shares of symbol at price, raising TradeError if not allowed.
+
+        Returns the transaction as a dict with the columns of the transactions table.
+        """
+
+        amount = shares * price
+        holding = self.holdings.get(symbol)
+
+        error = trade_error(side, amount, self.cash, holding[0] if holding else None, shares)
+        if error:
+            raise TradeError(error)
+
+        if side == "buy":
+            self.cash -= amount
+            if holding:
+                holding[0] += shares
+                holding[1] += amount
+            else:
+                # New holding carries over the net cost of earlier trades in the stock
+                prior_cost = self.costs.get(symbol, 0)
+                self.realized_gain += prior_cost
+                self.holdings[symbol] = [shares, prior_cost + amount]
+        else:
+            self.cash += amount
+            holding[0] -= shares
+            holding[1] -= amount
+            if holding[0] == 0:
+                del self.holdings[symbol]
+                self.realized_gain -= holding[1]
+            shares = -shares
+
+        self.costs[symbol] = self.costs.get(symbol, 0) + shares * price
+        return {"symbol": symbol, "shares": shares, "price": price, "timestamp": timestamp}
+
+
+def _tagged(symbol, bars):
+    for bar in bars:
+        yield bar.date, symbol, bar
+
+
+def merge_bars(series):
+    """Merge per-symbol bars (dict of symbol -> Bars, each oldest first) into one stream of (date, symbol, bar)."""
+
+    return heapq.merge(*(_tagged(symbol, bars) for symbol, bars in series.items()))
+
+
+def trading_days(stream, start=None, end=None):
+    """Group a merged stream into (date, {symbol: bar}) per day, between start and end (inclusive)."""
+
+    for day, group in itertools.groupby(stream, key=lambda item: item[0]):
+        if start is not None and day < start:
+            continue
+        if end is not None and day > end:
+            break
+        yield day, {symbol: bar for _, symbol, bar in group}
+
+
+def file_series(path):
+    """Bars of every symbol in a replay data file (CSV or Parquet, see providers.ReplayProvider)."""
+
+    return ReplayProvider(path).bars
+
+
+def stored_bars(columns, chunk=4096):
+    """Bars from memory-mapped columns, converting chunk rows at a time as they're consumed."""
+
+    for start in range(0, len(columns["date"]), chunk):
+        rows = zip(*(columns[name][start:start + chunk].tolist() for name, _ in COLUMNS))
+        for day, *values in rows:
+            yield Bar(from_day_number(day), *values)
+
+
+def store_series(symbols, store):
+    """Bars of symbols from the bar store, read from the memory-mapped columns a chunk at a time."""
+
+    return {symbol.upper(): stored_bars(store.columns(symbol)) for symbol in symbols}
+
+
+def run_backtest(days, strategy, ledger):
+    """Feed days to strategy and apply its orders to ledger at the day's close.
+
+    Yields each transaction as it's made. Orders the ledger rejects (like
+    buying without enough cash) are counted in ledger.rejected and skipped.
+    """
+
+    for day, bars in days:
+        closes = {symbol: bar.close for symbol, bar in bars.items()}
+        ledger.mark(closes)
+        timestamp = datetime.combine(day, time(16))
+
+        for side, symbol, shares in strategy.orders(day, closes, ledger):
+            try:
+                yield ledger.trade(side, symbol, shares, closes[symbol], timestamp)
+            except TradeError:
+                ledger.rejected += 1
+
+
+def write_transactions(transactions, f):
+    """Write transactions as CSV in the format of the history export. Returns the number written."""
+
+    writer = csv.writer(f)
+    writer.writerow(["symbol", "shares", "price", "timestamp"])
+
+    count = 0
+    for transaction in transactions:
+        writer.writerow([transaction["symbol"], transaction["shares"], transaction["price"], transaction["timestamp"].isoformat()])
+        count += 1
+    return count
+
+
+class BuyAndHold:
+    """Spend the cash equally on every symbol trading on the first day, then hold."""
+
+    def orders(self, day, closes, ledger):
+        if ledger.holdings or ledger.costs:
+            return []
+
+        budget = ledger.cash / len(closes)
+        return [("buy", symbol, int(budget // price)) for symbol, price in closes.items() if budget >= price > 0]
+
+
+class MovingAverageCross:
+    """Buy when a symbol's fast moving average crosses above the slow one, sell everything when it crosses below.
+
+    Each buy spends allocation (a fraction) of the cash at the time.
+    """
+
+    def __init__(self, fast=20, slow=50, allocation=0.1):
+        self.fast = fast
+        self.slow = slow
+        self.allocation = allocation
+        self.windows = {}  # symbol -> (closes of the slow window, sum of fast window, sum of slow window)
+        self.above = {}
+
+    def orders(self, day, closes, ledger):
+        orders = []
+
+        for symbol, price in closes.items():
+            window, fast_sum, slow_sum = self.windows.get(symbol) or (deque(), 0.0, 0.0)
+
+            # Running sums, so each day costs the same whatever the window lengths
+            window.append(price)
+            fast_sum += price
+            slow_sum += price
+            if len(window) > self.fast:
+                fast_sum -= window[-self.fast - 1]
+            if len(window) > self.slow:
+                slow_sum -= window.popleft()
+            self.windows[symbol] = (window, fast_sum, slow_sum)
+
+            if len(window) < self.slow:
+                continue
+
+            above = fast_sum / self.fast > slow_sum / self.slow
+            if above and self.above.get(symbol) is False:
+                shares = int(ledger.cash * self.allocation // price) if price > 0 else 0
+                if shares:
+                    orders.append(("buy", symbol, shares))
+            elif not above and self.above.get(symbol) and ledger.shares(symbol):
+                orders.append(("sell", symbol, ledger.shares(symbol)))
+            self.above[symbol] = above
+
+        return orders
+
+
+STRATEGIES = {
+    "buy-and-hold": BuyAndHold,
+    "sma-cross": MovingAverageCross,
+}
@@ -0,0 +1,188 @@
+import fcntl
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import numpy as np
+
+
+# Columns of the daily bar store, each kept in its own append-only file
+COLUMNS = (
+    ("date", "int64"), # Days since 1970-01-01
+    ("open", "float64"),
+    ("high", "float64"),
+    ("low", "float64"),
+    ("close", "float64"),
+    ("volume", "float64"),
+)
+
+EPOCH = date(1970, 1, 1)
+
+
+def day_number(day):
+    return (day - EPOCH).days
+
+
+def from_day_number(number):
+    return EPOCH + timedelta(days=int(number))
+
+
+def last_trading_day(day):
+    """Latest weekday on or before day (holidays aren't known, see BarStore.checked_on)."""
+    return day - timedelta(days=max(day.weekday() - 4, 0))
+
+
+def bars_to_columns(bars):
+    """Convert a list of providers.Bar to a dict of columns, as returned by the store."""
+    return {name: np.array([day_number(bar.date) if name == "date" else bar[index] for bar in bars], dtype=dtype)
+            for index, (name, dtype) in enumerate(COLUMNS)}
+
+
+class BarStore:
+    """Local store of daily price bars, one directory of column files per symbol.
+
+    Every column is a flat binary file (see COLUMNS) that new bars are
+    appended to and that is read back as a memory-mapped NumPy array, so range
+    queries read only the pages they touch. Writers take a file lock per
+    symbol, readers use the rows present in every column, so they never
+    see a half-appended bar.
+    """
+
+    def __init__(self, app=None):
+        self.directory = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config.get("BAR_STORE_DIR") or None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    def path(self, symbol, name):
+        # Symbols end up in file names, keep them to safe characters
+        symbol = re.sub(r"[^A-Z0-9.\-]", "_", symbol.upper())
+        return os.path.join(self.directory, symbol, name)
+
+    @contextmanager
+    def locked(self, symbol):
+        os.makedirs(os.path.dirname(self.path(symbol, ".lock")), exist_ok=True)
+        with self._lock, open(self.path(symbol, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def columns(self, symbol):
+        """Memory-mapped columns of symbol as a dict of name -> array (empty if none stored)."""
+
+        arrays = {}
+        for name, dtype in COLUMNS:
+            path = self.path(symbol, name)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if size:
+                arrays[name] = np.memmap(path, dtype=dtype, mode="r", shape=(size // np.dtype(dtype).itemsize,))
+            else:
+                arrays[name] = np.empty(0, dtype=dtype)
+
+        # Ignore a bar that is still being appended to some columns
+        rows = min(len(array) for array in arrays.values())
+        return {name: array[:rows] for name, array in arrays.items()}
+
+    def range(self, symbol, start=None, end=None):
+        """Bars of symbol between start and end dates (inclusive) as a dict of columns."""
+
+        columns = self.columns(symbol)
+        days = columns["date"]
+        first = 0 if start is None else np.searchsorted(days, day_number(start), side="left")
+        last = len(days) if end is None else np.searchsorted(days, day_number(end), side="right")
+        return {name: array[first:last] for name, array in columns.items()}
+
+    def last_date(self, symbol):
+        """Date of the newest stored bar of symbol (None if none)."""
+
+        days = self.columns(symbol)["date"]
+        return from_day_number(days[-1]) if len(days) else None
+
+    def _read_date(self, symbol, name):
+        try:
+            with open(self.path(symbol, name)) as f:
+                return date.fromisoformat(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _write_date(self, symbol, name, day):
+        with open(self.path(symbol, name), "w") as f:
+            f.write(day.isoformat())
+
+    def covered_since(self, symbol):
+        """Earliest date history of symbol has been downloaded from (None if never)."""
+        return self._read_date(symbol, "since")
+
+    def checked_on(self, symbol):
+        """Date history of symbol was last downloaded up to (None if never).
+
+        Days the market was closed have no bar, so this tells whether one
+        is still missing rather than never coming.
+        """
+        return self._read_date(symbol, "checked")
+
+    def merge(self, symbol, bars, since=None, checked=None):
+        """Store bars (providers.Bar, oldest first), replacing stored bars of the same dates.
+
+        since is the first date the bars were requested from, so later range
+        queries know history is complete from there even if the symbol
+        started trading later (or never did), and checked the date they were
+        requested up to. Both are recorded even if no bars came back.
+        """
+
+        with self.locked(symbol):
+            columns = self.columns(symbol)
+            days = columns["date"]
+            new = np.array([day_number(bar.date) for bar in bars], dtype="int64")
+
+            # Re-downloaded days already stored (before the newest one) are kept as they are
+            if len(days) and len(new) and new[0] < days[-1]:
+                older = new < days[-1]
+                if np.all(np.isin(new[older], days)):
+                    bars = [bar for bar, old in zip(bars, older) if not old]
+                    new = new[~older]
+
+            # Common case: only today's bar updated and/or newer bars added
+            # (written in place, never truncated, as readers may have the files mapped)
+            if len(new) and (not len(days) or new[0] >= days[-1]) and np.all(np.diff(new) > 0):
+                row = len(days) - 1 if len(days) and new[0] == days[-1] else len(days)
+                for index, (name, dtype) in enumerate(COLUMNS):
+                    path = self.path(symbol, name)
+                    values = new if name == "date" else np.array([bar[index] for bar in bars], dtype=dtype)
+                    with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                        f.seek(row * np.dtype(dtype).itemsize)
+                        f.write(values.tobytes())
+
+            # Backfill or out of order bars: rewrite the columns
+            elif len(new):
+                rows = {int(day): tuple(columns[name][i] for name, _ in COLUMNS) for i, day in enumerate(days)}
+                for bar in bars:
+                    rows[day_number(bar.date)] = (day_number(bar.date),) + tuple(bar[1:])
+
+                ordered = [rows[day] for day in sorted(rows)]
+                for index, (name, dtype) in enumerate(COLUMNS):
+                    path = self.path(symbol, name)
+                    np.array([row[index] for row in ordered], dtype=dtype).tofile(path + ".tmp")
+                    os.replace(path + ".tmp", path)
+
+            if since is not None and (self.covered_since(symbol) is None or since < self.covered_since(symbol)):
+                self._write_date(symbol, "since", since)
+            if checked is not None:
+                self._write_date(symbol, "checked", checked)
+
+
+bar_store = BarStore()
@@ -0,0 +1,98 @@
+"""Check that backtest ledgers keep the same books as real trades.
+
+Plays the same random sequence of buys and sells (including selling whole
+holdings and buying them back, and orders that get rejected) through a
+backtest.Ledger and through trades.execute_buy and execute_sell on a scratch
+SQLite database (or DATABASE_URL if set), then compares cash, holdings, cost
+basis, realized gain and which orders were rejected. Exits with status 1 if
+they differ:
+
+    python benchmarks/backtest_check.py --trades 2000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "backtest.db"))
+
+from app import app, db
+from backtest import Ledger
+from models import Holding, User
+from trades import TradeError, execute_buy, execute_sell, run_trade
+
+SYMBOLS = ["AAA", "BBB", "CCC"]
+STARTING_CASH = 10000.0
+
+
+def orders(count, seed):
+    """Random (side, symbol, shares, price), selling whole holdings now and then."""
+
+    rng = random.Random(seed)
+    for _ in range(count):
+        side = rng.choice(("buy", "buy", "sell"))
+        shares = rng.randint(1, 20) if rng.random() < 0.8 else None  # None: everything held
+        yield side, rng.choice(SYMBOLS), shares, round(rng.uniform(5, 200), 2)
+
+
+def close(a, b):
+    return abs(a - b) < 0.01
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--trades", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ledger = Ledger(STARTING_CASH)
+    problems = []
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username="ledger", email="ledger@example.com", password_hash="x", cash=STARTING_CASH)
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+        for number, (side, symbol, shares, price) in enumerate(orders(args.trades, args.seed)):
+            if shares is None:
+                shares = ledger.shares(symbol) or 1
+
+            try:
+                ledger.trade(side, symbol, shares, price, datetime.now())
+                ledger_ok = True
+            except TradeError:
+                ledger_ok = False
+
+            try:
+                run_trade(execute_buy if side == "buy" else execute_sell, user_id, symbol, shares, price)
+                db_ok = True
+            except TradeError:
+                db_ok = False
+
+            if ledger_ok != db_ok:
+                problems.append(f"trade {number} ({side} {shares} {symbol} at {price}): "
+                                f"ledger {'filled' if ledger_ok else 'rejected'}, database {'filled' if db_ok else 'rejected'}")
+
+        user = db.session.get(User, user_id)
+        holdings = {h.symbol: (h.shares, h.total_cost) for h in Holding.query.filter(Holding.user_id == user_id)}
+
+    if not close(ledger.cash, user.cash):
+        problems.append(f"cash: ledger {ledger.cash:.2f}, database {user.cash:.2f}")
+    if not close(ledger.realized_gain, user.realized_gain):
+        problems.append(f"realized gain: ledger {ledger.realized_gain:.2f}, database {user.realized_gain:.2f}")
+    for symbol in sorted(set(holdings) | set(ledger.holdings)):
+        shares, cost = ledger.holdings.get(symbol, (0, 0.0))
+        held, total_cost = holdings.get(symbol, (0, 0.0))
+        if shares != held or not close(cost, total_cost):
+            problems.append(f"{symbol}: ledger {shares} shares costing {cost:.2f}, database {held} costing {total_cost:.2f}")
+
+    for problem in problems[:20]:
+        print("FAIL", problem)
+    print(f"{args.trades} trades: " + ("ledger matches the database" if not problems else f"{len(problems)} differences"))
+    sys.exit(1 if problems else 0)
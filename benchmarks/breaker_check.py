@@ -0,0 +1,128 @@
+"""Check the stock API circuit breaker against the fault-injecting stub.
+
+Drives the breaker through fetch_quote (the provider path every lookup
+takes) while the local stub fails every request: the circuit must open
+once enough calls failed, then fail fast without calling the API, send a
+single probe after the cooldown (which reopens it while the API still
+fails) and close again once the API recovers. Also checks that a probe
+cancelled by a BaseException (like gevent.Timeout) doesn't leave the
+breaker half open, and that a slow call let through before the circuit
+opened can't settle the probe. Exits with status 1 if any step misbehaves:
+
+    python benchmarks/breaker_check.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from stub_server import StubServer
+
+COOLDOWN = 1
+MIN_CALLS = 3
+
+
+class Cancelled(BaseException):
+    """Stands in for gevent.Timeout and GreenletExit, which aren't Exceptions."""
+
+
+if __name__ == "__main__":
+    stub = StubServer().start()
+    scratch = tempfile.mkdtemp()
+    os.environ.update(
+        DATABASE_URL="sqlite:///" + os.path.join(scratch, "breaker.db"),
+        YAHOO_API_URL=stub.url,
+        NEWS_API_URL=stub.url,
+        LAST_PRICE_DIR=os.path.join(scratch, "last-prices"),
+        BAR_STORE_DIR=os.path.join(scratch, "bars"),
+        HTTP_RETRIES="0",
+        BREAKER_MIN_CALLS=str(MIN_CALLS),
+        BREAKER_FAILURE_RATE="0.5",
+        BREAKER_COOLDOWN=str(COOLDOWN),
+    )
+
+    # Importing the app configures the breaker and provider from the environment
+    import app  # noqa: F401
+    from breaker import CircuitBreaker, CircuitOpenError
+    from helpers import QuoteUnavailable, fetch_quote, quote_breaker
+
+    failures = 0
+
+    def check(description, ok):
+        global failures
+        failures += not ok
+        print(f"{'ok' if ok else 'FAIL':4}  {description}")
+
+    def attempt(symbol="AAPL"):
+        """Fetch a quote, returning the number of stub requests it made and whether it failed."""
+        before = stub.counts["requests"]
+        try:
+            fetch_quote(symbol)
+            failed = False
+        except QuoteUnavailable:
+            failed = True
+        return stub.counts["requests"] - before, failed
+
+    check("live quote with the API up", attempt() == (1, False) and quote_breaker.state == CircuitBreaker.CLOSED)
+
+    stub.fail_rate = 1.0
+    for _ in range(MIN_CALLS):
+        attempt()
+    check(f"opens after {MIN_CALLS} failed calls", quote_breaker.state == CircuitBreaker.OPEN)
+    check("fails fast while open (no API request)", attempt() == (0, True))
+
+    time.sleep(COOLDOWN + 0.1)
+    check("one probe after the cooldown, reopening while the API fails",
+          attempt() == (1, True) and quote_breaker.state == CircuitBreaker.OPEN)
+    check("fails fast again after the failed probe", attempt() == (0, True))
+
+    stub.fail_rate = 0.0
+    time.sleep(COOLDOWN + 0.1)
+    check("probe succeeds once the API is back and closes the circuit",
+          attempt() == (1, False) and quote_breaker.state == CircuitBreaker.CLOSED)
+
+    # A probe cancelled mid-call must release the half-open slot
+    breaker = CircuitBreaker("cancelled")
+    breaker.min_calls, breaker.cooldown = 1, 0
+    try:
+        breaker.call(lambda: 1 / 0)
+    except ZeroDivisionError:
+        pass
+
+    def cancelled():
+        raise Cancelled()
+
+    try:
+        breaker.call(cancelled)
+    except Cancelled:
+        pass
+    try:
+        breaker.call(lambda: None)
+        recovered = breaker.state == CircuitBreaker.CLOSED
+    except CircuitOpenError:
+        recovered = False
+    check("a cancelled probe doesn't leave the breaker half open", recovered)
+
+    # A call admitted while closed that finishes during the probe is no probe
+    breaker = CircuitBreaker("straggler")
+    breaker.min_calls, breaker.cooldown = 1, 0
+    straggler = breaker._before_call()
+    try:
+        breaker.call(lambda: 1 / 0)
+    except ZeroDivisionError:
+        pass
+    probe = breaker._before_call()
+    breaker._record(True, straggler)
+    settled = breaker.state != CircuitBreaker.HALF_OPEN
+    try:
+        breaker.call(lambda: None)
+        settled = True
+    except CircuitOpenError:
+        pass
+    breaker._record(False, probe)
+    check("a straggling call doesn't settle the half-open probe",
+          not settled and breaker.state == CircuitBreaker.OPEN)
+
+    sys.exit(1 if failures else 0)
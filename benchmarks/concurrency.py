@@ -0,0 +1,127 @@
+"""Measure concurrent request capacity per instance for each serving profile.
+
+Boots the app under Gunicorn with each worker class (see gunicorn.conf.py)
+against the local stub APIs with added latency, then fires concurrent quote
+page requests (a fresh stock each time, so every request waits on upstream):
+
+    python benchmarks/concurrency.py --clients 50 --requests 300 --latency 0.3
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_server import StubServer
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def symbols():
+    """Endless supply of distinct 5 letter stock symbols."""
+    letters = "ABCDEFGHIJKLMNOPQRSTUVW" # Stub treats X... as unknown
+    for n in count():
+        symbol = ""
+        for _ in range(5):
+            n, i = divmod(n, len(letters))
+            symbol += letters[i]
+        yield symbol
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run_profile(profile, args, stub_url, database_url):
+    port = free_port()
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        YAHOO_API_URL=stub_url,
+        NEWS_API_URL=stub_url,
+        GUNICORN_WORKER_CLASS=profile,
+        WEB_CONCURRENCY=str(args.workers),
+        GUNICORN_THREADS=str(args.threads if profile == "gthread" else 1),
+        HTTP_POOL_SIZE=str(max(args.clients, 8)),
+        QUOTE_CACHE_TTL="0",
+        NEWS_CACHE_TTL="0",
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-b", f"127.0.0.1:{port}", "app:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    base = f"http://127.0.0.1:{port}"
+    try:
+        # Wait for workers to come up
+        for _ in range(100):
+            try:
+                requests.get(base + "/", timeout=1)
+                break
+            except requests.RequestException:
+                time.sleep(0.1)
+
+        names = symbols()
+        urls = [f"{base}/quote/{next(names)}" for _ in range(args.requests)]
+
+        def fetch(url):
+            started = time.perf_counter()
+            ok = requests.get(url, timeout=60).status_code == 200
+            return time.perf_counter() - started, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            results = list(pool.map(fetch, urls))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = [latency for latency, _ in results]
+    return {
+        "profile": profile,
+        "throughput": len(results) / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "errors": sum(1 for _, ok in results if not ok),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", default="sync,gthread,gevent")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=8, help="threads per worker for gthread")
+    parser.add_argument("--clients", type=int, default=50, help="concurrent client connections")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.3, help="stub API latency in seconds")
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency).start()
+
+    # Quote pages don't need any rows, just the schema
+    database_url = os.getenv("DATABASE_URL") or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    subprocess.run([sys.executable, "-m", "flask", "db", "upgrade"], cwd=ROOT, check=True, capture_output=True,
+        env=dict(os.environ, DATABASE_URL=database_url, FLASK_APP="app.py"))
+
+    print(f"{args.requests} quote pages, {args.clients} concurrent clients, {args.workers} workers, "
+          f"{args.latency * 1000:.0f} ms upstream latency")
+    print(f"{'profile':10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+    for profile in args.profiles.split(","):
+        result = run_profile(profile, args, stub.url, database_url)
+        print(f"{result['profile']:10} {result['throughput']:8.1f} {result['p50'] * 1000:8.0f} "
+              f"{result['p95'] * 1000:8.0f} {result['errors']:7d}")
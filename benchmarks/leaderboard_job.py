@@ -0,0 +1,73 @@
+"""Time the leaderboard batch job and page on many users.
+
+Seeds users with random holdings in a scratch SQLite database (or
+DATABASE_URL if set), prices them against the local stub API, rebuilds the
+leaderboard and times serving it:
+
+    python benchmarks/leaderboard_job.py --users 100000 --symbols 300
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from stub_server import StubServer
+
+stub = StubServer().start()
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ["YAHOO_API_URL"] = stub.url
+os.environ["SQL_COUNT_HEADER"] = "1"
+
+from app import app, db
+from leaderboard import update_leaderboard
+from models import User, Holding
+
+
+def seed(users, symbols):
+    db.drop_all()
+    db.create_all()
+
+    rng = random.Random(0)
+    names = ["".join(rng.choice("ABCDEFGHIJKLMNOPQRSTUVW") for _ in range(4)) for _ in range(symbols)]
+
+    db.session.execute(User.__table__.insert(), [
+        {"id": i + 1, "username": f"user{i}", "email": f"user{i}@example.com", "password_hash": "x",
+         "cash": rng.uniform(0, 10000), "realized_gain": rng.uniform(-100, 100)}
+        for i in range(users)
+    ])
+
+    rows = []
+    for i in range(users):
+        for symbol in rng.sample(names, rng.randint(0, 6)):
+            shares = rng.randint(1, 50)
+            rows.append({"user_id": i + 1, "symbol": symbol, "shares": shares, "total_cost": shares * rng.uniform(10, 500)})
+    db.session.execute(Holding.__table__.insert(), rows)
+    db.session.commit()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--symbols", type=int, default=300)
+    args = parser.parse_args()
+
+    with app.app_context():
+        holdings = seed(args.users, args.symbols)
+        print(f"{args.users} users, {holdings} holdings, {args.symbols} symbols")
+
+        started = time.perf_counter()
+        ranked = update_leaderboard()
+        print(f"update-leaderboard: {time.perf_counter() - started:7.2f} s  "
+              f"({ranked} users ranked, {stub.counts['requests']} quote requests)")
+
+    client = app.test_client()
+    for by in ("value", "return"):
+        started = time.perf_counter()
+        response = client.get(f"/leaderboard?by={by}")
+        print(f"/leaderboard?by={by}: {(time.perf_counter() - started) * 1000:7.1f} ms  "
+              f"({response.headers['X-SQL-Statements']} SQL statements)")
@@ -0,0 +1,310 @@
+"""Load test the app end to end and save the results for comparing runs.
+
+Seeds a scratch SQLite database (or DATABASE_URL if set, use a scratch
+Postgres database) with users, holdings and transaction history, boots the
+app under Gunicorn against the local stub APIs with added latency, then has
+concurrent clients log in and mix register, quote, buy, sell, portfolio and
+history requests:
+
+    python benchmarks/loadtest.py --clients 20 --duration 30 --latency 0.1
+    python benchmarks/loadtest.py --compare loadtest-20261018-153000.json
+
+Reports p50/p95/p99 latency, throughput, and SQL statements and stock/news
+API calls per request for each kind of request (from the app's
+X-SQL-Statements and Server-Timing headers), and writes them to a JSON file.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from itertools import islice
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from concurrency import free_port, percentile, symbols
+from stub_server import StubServer
+
+PASSWORD = "Passw0rd!"
+
+# Share of each kind of request in the mix
+WEIGHTS = {
+    "quote": 30,
+    "portfolio": 20,
+    "history": 10,
+    "buy": 15,
+    "sell": 10,
+    "login": 10,
+    "register": 5,
+}
+
+
+def seed(database_url, users, holdings, transactions, universe):
+    """Create the schema and bulk insert users with holdings and their transaction history."""
+
+    os.environ["DATABASE_URL"] = database_url
+    from werkzeug.security import generate_password_hash
+    from app import app, db
+    from models import User, Holding, Transaction
+
+    rng = random.Random(0)
+    password_hash = generate_password_hash(PASSWORD)
+    now = datetime.now()
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        user_rows, holding_rows, transaction_rows = [], [], []
+        for user_id in range(1, users + 1):
+            owned = rng.sample(universe, min(rng.randint(1, holdings), len(universe)))
+
+            # Buys spread over the past year, adding up to each holding
+            for symbol in owned:
+                shares, cost = 0, 0.0
+                for _ in range(max(transactions // len(owned), 1)):
+                    bought, price = rng.randint(1, 20), round(rng.uniform(10, 500), 2)
+                    shares += bought
+                    cost += bought * price
+                    transaction_rows.append({"user_id": user_id, "symbol": symbol, "shares": bought, "price": price,
+                                             "timestamp": now - timedelta(minutes=rng.randint(1, 525600))})
+                holding_rows.append({"user_id": user_id, "symbol": symbol, "shares": shares, "total_cost": cost})
+
+            user_rows.append({"id": user_id, "username": f"user{user_id}", "email": f"user{user_id}@example.com",
+                              "password_hash": password_hash, "cash": 1000000.0, "realized_gain": 0.0})
+
+        db.session.execute(User.__table__.insert(), user_rows)
+        for table, rows in ((Holding.__table__, holding_rows), (Transaction.__table__, transaction_rows)):
+            for start in range(0, len(rows), 10000):
+                db.session.execute(table.insert(), rows[start:start + 10000])
+        db.session.commit()
+
+    return len(holding_rows), len(transaction_rows)
+
+
+def upstream_calls(header):
+    """Number of stock/news API requests in a Server-Timing header."""
+
+    match = re.search(r'upstream;dur=[\d.]+;desc="(\d+) call', header or "")
+    return int(match.group(1)) if match else 0
+
+
+class Client:
+    """One simulated user with their own session, recording each request."""
+
+    def __init__(self, base, users, universe, rng, results, lock):
+        self.base = base
+        self.users = users
+        self.universe = universe
+        self.rng = rng
+        self.results = results
+        self.lock = lock
+        self.session = requests.Session()
+        self.bought = []
+
+    def request(self, kind, method, path, data=None):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base + path, data=data, allow_redirects=False, timeout=60)
+        except requests.RequestException:
+            response = None
+        elapsed = time.perf_counter() - started
+
+        with self.lock:
+            self.results.append({
+                "kind": kind,
+                "started": started,
+                "latency": elapsed,
+                "ok": response is not None and response.status_code < 400,
+                "sql": int(response.headers.get("X-SQL-Statements", 0)) if response is not None else 0,
+                "upstream": upstream_calls(response.headers.get("Server-Timing")) if response is not None else 0,
+            })
+        return response
+
+    def login(self):
+        self.session.cookies.clear()
+        self.bought = []
+        username = f"user{self.rng.randint(1, self.users)}"
+        self.request("login", "POST", "/login", {"username": username, "password": PASSWORD})
+
+    def register(self):
+        self.session.cookies.clear()
+        self.bought = []
+        name = f"load{threading.get_ident()}x{self.rng.getrandbits(40)}"
+        self.request("register", "POST", "/register", {
+            "username": name, "email": f"{name}@example.com", "password": PASSWORD,
+            "password_confirmation": PASSWORD, "cash": "1000000",
+        })
+
+    def step(self):
+        kind = self.rng.choices(list(WEIGHTS), weights=list(WEIGHTS.values()))[0]
+
+        if kind == "login":
+            self.login()
+        elif kind == "register":
+            self.register()
+        elif kind == "quote":
+            self.request("quote", "GET", f"/quote/{self.rng.choice(self.universe)}")
+        elif kind == "portfolio":
+            self.request("portfolio", "GET", "/portfolio")
+        elif kind == "history":
+            self.request("history", "GET", "/history")
+        elif kind == "buy":
+            symbol = self.rng.choice(self.universe)
+            response = self.request("buy", "POST", "/buy", {"symbol": symbol, "shares": "1"})
+            if response is not None and response.status_code == 302:
+                self.bought.append(symbol)
+        elif self.bought:
+            self.request("sell", "POST", "/sell", {"symbol": self.bought.pop(), "shares": "1"})
+
+    def run(self, deadline):
+        self.login()
+        while time.perf_counter() < deadline:
+            self.step()
+
+
+def summarize(results, elapsed):
+    def stats(rows):
+        latencies = [row["latency"] for row in rows]
+        return {
+            "requests": len(rows),
+            "errors": sum(1 for row in rows if not row["ok"]),
+            "throughput": len(rows) / elapsed,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "sql_per_request": sum(row["sql"] for row in rows) / len(rows),
+            "upstream_per_request": sum(row["upstream"] for row in rows) / len(rows),
+        }
+
+    kinds = {}
+    for row in results:
+        kinds.setdefault(row["kind"], []).append(row)
+
+    summary = {kind: stats(rows) for kind, rows in sorted(kinds.items())}
+    summary["all"] = stats(results)
+    return summary
+
+
+def print_summary(summary, previous=None):
+    print(f"{'request':10} {'count':>6} {'err':>4} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'sql/req':>8} {'api/req':>8}")
+    for kind, row in summary.items():
+        line = (f"{kind:10} {row['requests']:6d} {row['errors']:4d} {row['throughput']:7.1f} {row['p50_ms']:8.1f} "
+                f"{row['p95_ms']:8.1f} {row['p99_ms']:8.1f} {row['sql_per_request']:8.2f} {row['upstream_per_request']:8.2f}")
+        if previous and kind in previous:
+            before = previous[kind]
+            line += f"   p95 {row['p95_ms'] - before['p95_ms']:+.1f} ms, {row['throughput'] - before['throughput']:+.1f} req/s"
+        print(line)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=20, help="concurrent simulated users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run for")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds at the start left out of the results")
+    parser.add_argument("--latency", type=float, default=0.1, help="stub API latency in seconds")
+    parser.add_argument("--users", type=int, default=1000, help="seeded users")
+    parser.add_argument("--holdings", type=int, default=10, help="most holdings per seeded user")
+    parser.add_argument("--transactions", type=int, default=50, help="transactions per seeded user")
+    parser.add_argument("--symbols", type=int, default=200, help="stocks traded")
+    parser.add_argument("--worker-class", default="gthread", help="Gunicorn worker class (see gunicorn.conf.py)")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=8, help="threads per worker for gthread")
+    parser.add_argument("--output", help="JSON file to write (loadtest-<time>.json by default)")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare with")
+    args = parser.parse_args()
+
+    stub = StubServer(latency=args.latency).start()
+    scratch = tempfile.mkdtemp()
+    database_url = os.getenv("DATABASE_URL") or "sqlite:///" + os.path.join(scratch, "loadtest.db")
+    universe = list(islice(symbols(), args.symbols))
+
+    started = time.perf_counter()
+    holdings, transactions = seed(database_url, args.users, args.holdings, args.transactions, universe)
+    print(f"Seeded {args.users} users, {holdings} holdings, {transactions} transactions in {time.perf_counter() - started:.1f}s")
+
+    port = free_port()
+    env = dict(
+        os.environ,
+        DATABASE_URL=database_url,
+        YAHOO_API_URL=stub.url,
+        NEWS_API_URL=stub.url,
+        BAR_STORE_DIR=os.path.join(scratch, "bars"),
+        LAST_PRICE_DIR=os.path.join(scratch, "last-prices"),
+        GUNICORN_WORKER_CLASS=args.worker_class,
+        WEB_CONCURRENCY=str(args.workers),
+        GUNICORN_THREADS=str(args.threads if args.worker_class == "gthread" else 1),
+        HTTP_POOL_SIZE=str(max(args.clients, 8)),
+        SECRET_KEY=os.getenv("SECRET_KEY", "loadtest"),
+        SQL_COUNT_HEADER="1",
+        SERVER_TIMING_HEADER="1",
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-b", f"127.0.0.1:{port}", "app:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    base = f"http://127.0.0.1:{port}"
+    results = []
+    lock = threading.Lock()
+    try:
+        # Wait for workers to come up
+        for _ in range(100):
+            try:
+                requests.get(base + "/", timeout=1)
+                break
+            except requests.RequestException:
+                time.sleep(0.1)
+
+        upstream_before = stub.counts["requests"]
+        started = time.perf_counter()
+        deadline = started + args.duration
+        clients = [Client(base, args.users, universe, random.Random(seed), results, lock) for seed in range(args.clients)]
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            list(pool.map(lambda client: client.run(deadline), clients))
+        upstream_requests = stub.counts["requests"] - upstream_before
+    finally:
+        server.terminate()
+        server.wait()
+
+    measured = [row for row in results if row["started"] >= started + args.warmup]
+    summary = summarize(measured, max(args.duration - args.warmup, 0.001))
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["results"]
+
+    print(f"{len(measured)} requests from {args.clients} clients over {args.duration - args.warmup:.0f}s "
+          f"({args.worker_class}, {args.workers} workers, {args.latency * 1000:.0f} ms API latency, "
+          f"{upstream_requests} stub API requests)")
+    print_summary(summary, previous)
+
+    output = args.output or f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(output, "w") as f:
+        json.dump({
+            "commit": git_commit(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "settings": vars(args),
+            "database": database_url.split(":", 1)[0],
+            "stub_requests": upstream_requests,
+            "results": summary,
+        }, f, indent=2)
+    print(f"Saved {output}")
@@ -0,0 +1,67 @@
+"""Check that the matching engine picks up orders committed out of id order.
+
+On PostgreSQL an order's id is handed out before its transaction commits,
+so order 10 can become visible after order 11. Simulates that in a scratch
+SQLite database (or DATABASE_URL if set) by inserting the higher id first,
+syncing, then inserting the lower one, and checks that both end up in the
+books and that a price crossing them fills both. Exits with status 1 if not:
+
+    python benchmarks/matching_check.py
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "matching.db"))
+
+from app import app, db
+from matching import MatchingEngine
+from models import Order, User
+
+
+def place(order_id):
+    db.session.execute(Order.__table__.insert(), [{
+        "id": order_id, "user_id": 1, "symbol": "AAPL", "side": "buy", "kind": "limit", "shares": 1,
+        "price": 100.0, "status": "open", "created_at": datetime.now(),
+    }])
+    db.session.commit()
+
+
+if __name__ == "__main__":
+    failures = 0
+
+    def check(description, ok):
+        global failures
+        failures += not ok
+        print(f"{'ok' if ok else 'FAIL':4}  {description}")
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(User(id=1, username="match", email="match@example.com", password_hash="x", cash=10000.0))
+        db.session.commit()
+
+    engine = MatchingEngine(app)
+
+    with app.app_context():
+        place(11)
+    engine.sync()
+    check("order 11 loaded", 11 in engine.books["AAPL"].live)
+
+    # Order 10 commits only now, after a sync already saw 11
+    with app.app_context():
+        place(10)
+    engine.sync()
+    check("order 10 loaded after committing late", 10 in engine.books["AAPL"].live)
+    check("no order loaded twice", len(engine.books["AAPL"]) == 2)
+
+    filled = engine.match({"AAPL": {"symbol": "AAPL", "price": 99.0}})
+    check("both filled once the price crosses", filled == 2)
+
+    with app.app_context():
+        statuses = {order.id: order.status for order in Order.query}
+    check("both marked filled", statuses == {10: "filled", 11: "filled"})
+
+    sys.exit(1 if failures else 0)
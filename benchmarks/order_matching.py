@@ -0,0 +1,129 @@
+"""Time matching price updates against a million resting limit and stop orders.
+
+Fills order books with random orders around each symbol's price, then
+plays a random walk of prices through them, timing the heap-based books of
+matching.py against scanning every open order of the symbol:
+
+    python benchmarks/order_matching.py --orders 1000000 --symbols 500 --ticks 100000
+
+With --db the orders are written to a scratch SQLite database (or
+DATABASE_URL if set) first and the books are rebuilt from it, as at startup.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from app import app, db
+from matching import MatchingEngine, OrderBook
+from models import Order
+
+
+def random_orders(count, symbols, rng):
+    """Starting prices of the symbols and (id, symbol, side, kind, price) of each order."""
+
+    prices = {f"S{i}": rng.uniform(10, 500) for i in range(symbols)}
+    names = list(prices)
+
+    orders = []
+    for order_id in range(1, count + 1):
+        symbol = rng.choice(names)
+        side = rng.choice(("buy", "sell"))
+        kind = rng.choice(("limit", "stop"))
+        # Resting: buy limits and sell stops below the price, the others above
+        below = (side == "buy") == (kind == "limit")
+        offset = rng.uniform(0.001, 0.2)
+        price = round(prices[symbol] * (1 - offset if below else 1 + offset), 2)
+        orders.append((order_id, symbol, side, kind, price))
+
+    return prices, orders
+
+
+def scan(orders, price):
+    """Triggered orders by checking every open order (what the books avoid)."""
+
+    triggered = []
+    for order in orders:
+        order_id, side, kind, trigger = order
+        if (side == "buy") == (kind == "limit"):
+            crossed = price <= trigger
+        else:
+            crossed = price >= trigger
+        if crossed:
+            triggered.append(order_id)
+
+    if triggered:
+        ids = set(triggered)
+        orders[:] = [order for order in orders if order[0] not in ids]
+    return triggered
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=1000000)
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--ticks", type=int, default=100000)
+    parser.add_argument("--scan-ticks", type=int, default=200, help="Ticks to time the full scan on (it's slow).")
+    parser.add_argument("--db", action="store_true", help="Rebuild the books from the orders table.")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    prices, orders = random_orders(args.orders, args.symbols, rng)
+
+    if args.db:
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            db.session.execute(db.text("INSERT INTO users (id, username, email, password_hash, cash, realized_gain) "
+                                       "VALUES (1, 'bench', 'bench@example.com', 'x', 0, 0)"))
+            now = datetime.now()
+            for start in range(0, len(orders), 50000):
+                db.session.execute(Order.__table__.insert(), [
+                    {"id": order_id, "user_id": 1, "symbol": symbol, "side": side, "kind": kind, "shares": 1,
+                     "price": price, "status": "open", "created_at": now}
+                    for order_id, symbol, side, kind, price in orders[start:start + 50000]
+                ])
+            db.session.commit()
+
+        engine = MatchingEngine(app)
+        started = time.perf_counter()
+        engine.sync()
+        print(f"rebuild from database: {time.perf_counter() - started:7.2f} s  ({args.orders} open orders)")
+        books = engine.books
+    else:
+        started = time.perf_counter()
+        books = {}
+        for order_id, symbol, side, kind, price in orders:
+            books.setdefault(symbol, OrderBook()).add(order_id, side, kind, price)
+        print(f"build books:           {time.perf_counter() - started:7.2f} s  ({args.orders} open orders)")
+
+    lists = {}
+    for order_id, symbol, side, kind, price in orders:
+        lists.setdefault(symbol, []).append((order_id, side, kind, price))
+
+    # Random walk of prices, one symbol per tick
+    names = list(prices)
+    ticks = []
+    for _ in range(args.ticks):
+        symbol = rng.choice(names)
+        prices[symbol] *= 1 + rng.gauss(0, 0.01)
+        ticks.append((symbol, prices[symbol]))
+
+    started = time.perf_counter()
+    triggered = sum(len(books[symbol].crossed(price)) for symbol, price in ticks)
+    elapsed = time.perf_counter() - started
+    print(f"order books:           {elapsed / len(ticks) * 1e6:7.2f} us/tick  "
+          f"({len(ticks)} ticks, {triggered} orders triggered, {sum(map(len, books.values()))} still resting)")
+
+    ticks = ticks[:args.scan_ticks]
+    started = time.perf_counter()
+    triggered = sum(len(scan(lists[symbol], price)) for symbol, price in ticks)
+    elapsed = time.perf_counter() - started
+    print(f"scan open orders:      {elapsed / len(ticks) * 1e6:7.2f} us/tick  ({len(ticks)} ticks, {triggered} orders triggered)")
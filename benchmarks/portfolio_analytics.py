@@ -0,0 +1,95 @@
+"""Time the portfolio analytics on a large synthetic history.
+
+Builds daily closes for many symbols over several years plus a random trade
+history, then times the vectorized analytics against a plain Python loop
+over days computing just the equity curve:
+
+    python benchmarks/portfolio_analytics.py --years 10 --symbols 500 --trades 20000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from analytics import performance, portfolio_series
+
+
+def synthetic(years, symbols, trades, seed=0):
+    rng = np.random.default_rng(seed)
+    days = np.arange(years * 365) + 16000
+
+    # Random walk closes for every symbol on every day
+    names = [f"S{i:03d}" for i in range(symbols)]
+    closes = 100 * np.exp(np.cumsum(rng.normal(0.0003, 0.02, (len(days), symbols)), axis=0))
+    history = {name: {"date": days, "close": closes[:, i]} for i, name in enumerate(names)}
+
+    # Buys, then sales of part of what was bought, at that day's close
+    column = rng.integers(0, symbols, trades)
+    row = np.sort(rng.integers(0, len(days), trades))
+    shares = rng.integers(1, 20, trades).astype("float64")
+    sells = np.flatnonzero(rng.random(trades) < 0.3)
+    shares[sells] = -1
+    held = np.zeros(symbols)
+    for i in range(trades): # Keep sales covered by earlier buys
+        if held[column[i]] + shares[i] < 0:
+            shares[i] = 1
+        held[column[i]] += shares[i]
+
+    return {
+        "date": days[row],
+        "symbol": np.array(names)[column],
+        "shares": shares,
+        "price": closes[row, column],
+    }, history
+
+
+def loop_equity(trades, history, starting_cash):
+    """Equity curve the straightforward way: a Python loop per day and symbol."""
+
+    days = sorted(set(trades["date"].tolist()) | set(history[next(iter(history))]["date"].tolist()))
+    days = [day for day in days if day >= trades["date"].min()]
+    closes = {symbol: dict(zip(bars["date"].tolist(), bars["close"].tolist())) for symbol, bars in history.items()}
+
+    positions, cash, equity, i = {}, starting_cash, [], 0
+    for day in days:
+        while i < len(trades["date"]) and trades["date"][i] == day:
+            symbol = trades["symbol"][i]
+            positions[symbol] = positions.get(symbol, 0) + trades["shares"][i]
+            cash -= trades["shares"][i] * trades["price"][i]
+            i += 1
+        equity.append(cash + sum(shares * closes[symbol][day] for symbol, shares in positions.items()))
+    return equity
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--trades", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--skip-loop", action="store_true", help="don't time the Python loop")
+    args = parser.parse_args()
+
+    trades, history = synthetic(args.years, args.symbols, args.trades)
+    starting_cash = float(np.dot(trades["shares"], trades["price"])) + 10000
+    print(f"{args.years} years x {args.symbols} symbols, {args.trades} trades")
+
+    timings = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        series = portfolio_series(trades, history, starting_cash)
+        stats = performance(series)
+        timings.append(time.perf_counter() - started)
+    print(f"vectorized:  {min(timings) * 1000:8.1f} ms (best of {args.repeat})")
+    print(f"  return {stats['time_weighted_return']:.2%}, volatility {stats['volatility']:.2%}, "
+          f"max drawdown {stats['max_drawdown']:.2%}, Sharpe {stats['sharpe_ratio']:.2f}")
+
+    if not args.skip_loop:
+        started = time.perf_counter()
+        equity = loop_equity(trades, history, starting_cash)
+        print(f"python loop: {(time.perf_counter() - started) * 1000:8.1f} ms (equity curve only)")
+        print(f"  equity curves match: {np.allclose(equity, series.equity)}")
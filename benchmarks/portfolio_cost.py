@@ -0,0 +1,102 @@
+"""Compare the old Python-loop and new grouped-SQL portfolio cost basis.
+
+Seeds a user with a large transaction history in a scratch SQLite database
+(or DATABASE_URL if set) and times both paths:
+
+    python benchmarks/portfolio_cost.py --transactions 50000 --symbols 40
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from app import app, db
+from models import User, Transaction
+
+
+def seed(transactions, symbols):
+    db.drop_all()
+    db.create_all()
+
+    user = User(username="bench", email="bench@example.com", password_hash="x", cash=0)
+    db.session.add(user)
+    db.session.flush()
+
+    names = [f"S{i:03d}" for i in range(symbols)]
+    start = datetime(2015, 1, 1)
+    rows = [
+        {
+            "user_id": user.id,
+            "symbol": random.choice(names),
+            "shares": random.choice([1, 2, 5, 10, -1, -2]),
+            "price": round(random.uniform(10, 500), 2),
+            "timestamp": start + timedelta(minutes=i),
+        }
+        for i in range(transactions)
+    ]
+    db.session.execute(Transaction.__table__.insert(), rows)
+    db.session.commit()
+    return user.id, names
+
+
+def old_path(user_id, symbols):
+    """Cost basis as app.portfolio computed it before (relationship + Python loops)."""
+    user = db.session.get(User, user_id)
+    transactions = user.transactions
+
+    costs = {}
+    for symbol in symbols:
+        cost = 0
+        for transaction in transactions:
+            if transaction.symbol == symbol:
+                cost += transaction.shares * transaction.price
+        costs[symbol] = cost
+
+    portfolio_cost = 0
+    for transaction in transactions:
+        portfolio_cost += transaction.shares * transaction.price
+    return costs, portfolio_cost
+
+
+def new_path(user_id, symbols):
+    costs = Transaction.cost_by_symbol(user_id)
+    return {symbol: costs.get(symbol, 0) for symbol in symbols}, sum(costs.values())
+
+
+def timed(fn, *args, repeat=5):
+    best = None
+    for _ in range(repeat):
+        db.session.expire_all()
+        started = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transactions", type=int, default=50000)
+    parser.add_argument("--symbols", type=int, default=40)
+    args = parser.parse_args()
+
+    with app.app_context():
+        user_id, symbols = seed(args.transactions, args.symbols)
+
+        (old_costs, old_total), old_time = timed(old_path, user_id, symbols)
+        (new_costs, new_total), new_time = timed(new_path, user_id, symbols)
+
+        # Same math, only the summation order differs
+        assert abs(old_total - new_total) < 1e-6 * max(1, abs(old_total))
+        for symbol in symbols:
+            assert abs(old_costs[symbol] - new_costs[symbol]) < 1e-6 * max(1, abs(old_costs[symbol]))
+
+        print(f"{args.transactions} transactions, {args.symbols} symbols")
+        print(f"old (Python loops): {old_time * 1000:9.2f} ms")
+        print(f"new (grouped SQL):  {new_time * 1000:9.2f} ms  ({old_time / new_time:.1f}x faster)")
@@ -0,0 +1,72 @@
+"""Time the end of day portfolio snapshot job and reading a user's snapshots.
+
+Seeds users with random holdings (as benchmarks/leaderboard_job.py does),
+writes one snapshot per user for each of --days days and times reading a
+year of one user's snapshots through the (user_id, date) index:
+
+    python benchmarks/portfolio_snapshots.py --users 100000 --days 5
+
+Then takes one more snapshot with the stub API failing and exits with
+status 1 unless every holding was valued at cost rather than at a stale
+last known price.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import func
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from leaderboard_job import app, db, seed, stub
+from cache import price_snapshot, quote_cache
+from models import Holding, PortfolioSnapshot
+from snapshots import take_snapshots
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--symbols", type=int, default=300)
+    parser.add_argument("--days", type=int, default=5)
+    args = parser.parse_args()
+
+    with app.app_context():
+        holdings = seed(args.users, args.symbols)
+        print(f"{args.users} users, {holdings} holdings, {args.symbols} symbols")
+
+        for offset in range(args.days, 0, -1):
+            started = time.perf_counter()
+            written = take_snapshots(day=date.today() - timedelta(days=offset - 1))
+            print(f"snapshot-portfolios: {time.perf_counter() - started:7.2f} s  "
+                  f"({written} rows, {stub.counts['requests']} quote requests so far)")
+
+        plan = db.session.execute(db.text(
+            "EXPLAIN QUERY PLAN SELECT * FROM portfolio_snapshots WHERE user_id = 1 AND date >= '2000-01-01'"
+        )).fetchall() if db.engine.dialect.name == "sqlite" else []
+        for row in plan:
+            print(f"plan: {row[-1]}")
+
+        reads = min(args.users, 1000)
+        started = time.perf_counter()
+        for user_id in range(1, reads + 1):
+            PortfolioSnapshot.query.filter((PortfolioSnapshot.user_id == user_id)
+                                           & (PortfolioSnapshot.date >= date.today() - timedelta(days=365))).all()
+        print(f"read one user's year: {(time.perf_counter() - started) * 1000 / reads:7.3f} ms avg over {reads} users")
+
+        # Stock API down: quotes fall back to last known prices, flagged stale
+        stub.fail_rate = 1.0
+        quote_cache.backend.clear()
+        price_snapshot.backend.clear()
+        day = date.today() + timedelta(days=1)
+        take_snapshots(day=day)
+
+        costs = dict(db.session.query(Holding.user_id, func.sum(Holding.total_cost)).group_by(Holding.user_id))
+        snapshots = db.session.query(PortfolioSnapshot.user_id, PortfolioSnapshot.holdings_value) \
+            .filter(PortfolioSnapshot.date == day)
+        wrong = sum(1 for user_id, value in snapshots if abs(value - costs.get(user_id, 0)) > 0.01)
+        print(f"{'FAIL' if wrong else 'ok':4}  stock API down: {wrong} users valued at stale prices instead of cost")
+
+    sys.exit(1 if wrong else 0)
@@ -0,0 +1,58 @@
+"""Check that the routes' hot queries are served by an index.
+
+Builds the schema in a scratch SQLite database and runs EXPLAIN QUERY PLAN on
+each query. Exits with status 1 if any of them scans a table instead:
+
+    python benchmarks/query_plans.py
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "plans.db")
+
+from app import app, db
+from models import Holding, Transaction
+
+USER_ID = 1
+SYMBOL = "AAPL"
+
+
+def queries():
+    """(description, query) for each hot query, built the way the routes build them."""
+    return [
+        ("holding for stock (buy, sell, quote)",
+            Holding.query.filter((Holding.user_id == USER_ID) & (Holding.symbol == SYMBOL))),
+        ("user's holdings (portfolio, sell)",
+            Holding.query.filter(Holding.user_id == USER_ID)),
+        ("cost of stock (buy)",
+            db.session.query(Transaction.symbol, db.func.sum(Transaction.shares * Transaction.price))
+            .filter((Transaction.user_id == USER_ID) & (Transaction.symbol == SYMBOL)).group_by(Transaction.symbol)),
+        ("user's transactions (history)",
+            Transaction.query.filter(Transaction.user_id == USER_ID)
+            .order_by(Transaction.timestamp.desc(), Transaction.id.desc()).limit(51)),
+    ]
+
+
+def plan(query):
+    sql = str(query.statement.compile(db.engine, compile_kwargs={"literal_binds": True}))
+    rows = db.session.execute(db.text("EXPLAIN QUERY PLAN " + sql)).fetchall()
+    return [row[-1] for row in rows]
+
+
+if __name__ == "__main__":
+    failures = 0
+
+    with app.app_context():
+        db.create_all()
+
+        for description, query in queries():
+            steps = plan(query)
+            # "SCAN <table>" without an index means reading every row
+            scans = [step for step in steps if step.startswith("SCAN") and "INDEX" not in step]
+            status = "FAIL" if scans else "ok"
+            failures += bool(scans)
+            print(f"{status:4}  {description}: {'; '.join(steps)}")
+
+    sys.exit(1 if failures else 0)
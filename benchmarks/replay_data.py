@@ -0,0 +1,56 @@
+"""Generate a price file for the replay market data provider.
+
+Writes daily closes (a random walk per symbol) with Symbol, Date and Close
+columns, then run the app without network access:
+
+    python benchmarks/replay_data.py --symbols 500 --days 250 /tmp/replay.csv
+    export MARKET_DATA_PROVIDER=replay REPLAY_DATA_PATH=/tmp/replay.csv
+
+Symbols are AAA, AAB, ... so they pass the app's symbol validation. Writing
+a .parquet path needs pyarrow.
+"""
+import argparse
+import csv
+import itertools
+import random
+import string
+from datetime import date, timedelta
+
+
+def symbols(count):
+    letters = itertools.product(string.ascii_uppercase, repeat=3)
+    return ["".join(combo) for combo in itertools.islice(letters, count)]
+
+
+def rows(count, days, seed=0):
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=days)
+
+    for symbol in symbols(count):
+        price = rng.uniform(10, 500)
+        for i in range(days):
+            price = max(price * (1 + rng.gauss(0.0003, 0.02)), 0.01)
+            yield {"Symbol": symbol, "Date": (start + timedelta(days=i + 1)).isoformat(), "Close": round(price, 2)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--days", type=int, default=250)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data = rows(args.symbols, args.days, args.seed)
+
+    if args.path.endswith(".parquet"):
+        import pyarrow
+        import pyarrow.parquet
+        pyarrow.parquet.write_table(pyarrow.Table.from_pylist(list(data)), args.path)
+    else:
+        with open(args.path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["Symbol", "Date", "Close"])
+            writer.writeheader()
+            writer.writerows(data)
+
+    print(f"Wrote {args.symbols} symbols x {args.days} days to {args.path}")
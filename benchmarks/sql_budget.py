@@ -0,0 +1,80 @@
+"""Check that pages run a fixed number of SQL statements, however much a user holds.
+
+Logs in through the test client as a user with many holdings, transactions
+and orders (in a scratch SQLite database, against the local stub APIs) and
+requests each page with TestingConfig and SQL_STATEMENT_BUDGET set, so a
+page over budget raises (see instrumentation.SQLCounter). Also checks each
+page against its own budget from the X-SQL-Statements header. Exits with
+status 1 if any page is over:
+
+    python benchmarks/sql_budget.py
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from stub_server import StubServer
+
+# Statements each page may run: loading the user (with the relationships the
+# route declares) plus the page's own queries, none of them per holding
+BUDGETS = {
+    "/portfolio": 2,
+    "/sell": 2,
+    "/quote/AAPL": 2,
+    "/history": 2,
+}
+
+HOLDINGS = 20
+PASSWORD = "Passw0rd!"
+
+if __name__ == "__main__":
+    stub = StubServer().start()
+    scratch = tempfile.mkdtemp()
+    os.environ.update(
+        APP_SETTINGS="config.TestingConfig",
+        DATABASE_URL="sqlite:///" + os.path.join(scratch, "budget.db"),
+        YAHOO_API_URL=stub.url,
+        NEWS_API_URL=stub.url,
+        LAST_PRICE_DIR=os.path.join(scratch, "last-prices"),
+        BAR_STORE_DIR=os.path.join(scratch, "bars"),
+        SECRET_KEY=os.getenv("SECRET_KEY", "sql-budget"),
+        SQL_COUNT_HEADER="1",
+        SQL_STATEMENT_BUDGET=str(max(BUDGETS.values())),
+    )
+
+    from werkzeug.security import generate_password_hash
+    from app import app, db
+    from models import Holding, Transaction, User
+
+    with app.app_context():
+        db.create_all()
+        user = User(username="budget", email="budget@example.com", password_hash=generate_password_hash(PASSWORD),
+                    cash=100000.0, realized_gain=0.0)
+        db.session.add(user)
+        db.session.flush()
+        for i in range(HOLDINGS):
+            symbol = "S" + chr(ord("A") + i)
+            db.session.add(Holding(user_id=user.id, symbol=symbol, shares=10, total_cost=1000.0))
+            db.session.add(Transaction(user_id=user.id, symbol=symbol, shares=10, price=100.0, timestamp=datetime.now()))
+        db.session.commit()
+
+    client = app.test_client()
+    client.post("/login", data={"username": "budget", "password": PASSWORD})
+
+    failures = 0
+    for path, budget in BUDGETS.items():
+        try:
+            response = client.get(path)
+            count = int(response.headers.get("X-SQL-Statements", 0))
+            ok = response.status_code == 200 and count <= budget
+            detail = f"{count} statements (budget {budget}), status {response.status_code}"
+        except AssertionError as e:
+            ok, detail = False, str(e)
+
+        failures += not ok
+        print(f"{'ok' if ok else 'FAIL':4}  {path}: {detail}")
+
+    sys.exit(1 if failures else 0)
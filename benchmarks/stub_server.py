@@ -0,0 +1,162 @@
+"""Local stand-in for the Yahoo Finance and News APIs.
+
+Serves deterministic prices and articles so the app can be run and measured
+without network access. Point the app at it with:
+
+    export YAHOO_API_URL=http://127.0.0.1:8900
+    export NEWS_API_URL=http://127.0.0.1:8900
+    python benchmarks/stub_server.py --port 8900 --latency 0.05
+
+Faults can be injected with --fail-rate (fraction of API requests answered
+with --fail-status) or changed while running:
+
+    curl "http://127.0.0.1:8900/_stub/faults?rate=1&status=503&latency=0"
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def base_price(symbol):
+    """Stable pseudo-random price for symbol (between $10 and $500)."""
+    return 10 + zlib.crc32(symbol.encode()) % 49000 / 100
+
+
+def yahoo_csv(symbol, days=7):
+    rows = ["Date,Open,High,Low,Close,Adj Close,Volume"]
+    price = base_price(symbol)
+    today = datetime.utcnow().date()
+    for i in range(days, 0, -1):
+        close = round(price * (1 + ((zlib.crc32(f"{symbol}{i}".encode()) % 200) - 100) / 10000), 2)
+        date = (today - timedelta(days=i)).isoformat()
+        rows.append(f"{date},{close},{close},{close},{close},{close},100000")
+    return "\n".join(rows) + "\n"
+
+
+def news_json(query, count=20):
+    articles = [
+        {
+            "source": {"id": None, "name": "Stub News"},
+            "author": "stub",
+            "title": f"{query} article {i}",
+            "description": f"Generated article {i} about {query}.",
+            "url": f"https://example.com/{query}/{i}",
+            "urlToImage": "https://example.com/image.png",
+            "publishedAt": "2023-03-15T13:56:25Z",
+            "content": "",
+        }
+        for i in range(count)
+    ]
+    return json.dumps({"status": "ok", "totalResults": count, "articles": articles})
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+
+        # Fault injection controls (not counted as API requests)
+        if url.path == "/_stub/faults":
+            params = parse_qs(url.query)
+            self.server.fail_rate = float(params.get("rate", [self.server.fail_rate])[0])
+            self.server.fail_status = int(params.get("status", [self.server.fail_status])[0])
+            self.server.latency = float(params.get("latency", [self.server.latency])[0])
+            return self.send(200, json.dumps(self.server.faults()), "application/json")
+
+        self.server.count("requests")
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if self.server.fail_rate and random.random() < self.server.fail_rate:
+            self.server.count("failures")
+            return self.send(self.server.fail_status, "Injected failure", "text/plain")
+
+        if url.path.startswith("/v7/finance/download/"):
+            symbol = url.path.rsplit("/", 1)[-1].upper()
+            if symbol.startswith("X"):
+                # Symbols starting with X are treated as unknown
+                return self.send(404, "Not Found", "text/plain")
+            params = parse_qs(url.query)
+            days = 7
+            if "period1" in params and "period2" in params:
+                days = max((int(params["period2"][0]) - int(params["period1"][0])) // 86400, 1)
+            return self.send(200, yahoo_csv(symbol, days), "text/csv")
+
+        if url.path == "/v2/everything":
+            query = parse_qs(url.query).get("q", [""])[0]
+            count = int(parse_qs(url.query).get("pageSize", ["20"])[0])
+            return self.send(200, news_json(query, count), "application/json")
+
+        self.send(404, "Not Found", "text/plain")
+
+    def send(self, status, body, content_type):
+        body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.0, fail_rate=0.0, fail_status=503):
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.counts = {"connections": 0, "requests": 0, "failures": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def faults(self):
+        return {"rate": self.fail_rate, "status": self.fail_status, "latency": self.latency}
+
+    def handle_error(self, request, client_address):
+        # Clients giving up on slow responses is expected, not worth a traceback
+        pass
+
+    def start(self):
+        """Serve from a background thread (for use inside other scripts)."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--fail-status", type=int, default=503, help="status code of failed requests")
+    args = parser.parse_args()
+
+    server = StubServer(args.port, args.latency, args.fail_rate, args.fail_status)
+    print(f"Stub API listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(server.counts)
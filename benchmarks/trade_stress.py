@@ -0,0 +1,117 @@
+"""Stress the trade engine with parallel orders against one account.
+
+Many threads submit random buys and sells for the same user at once (like
+double-clicks and API retries) against a local database, then the balances
+are checked against the transaction log:
+
+    python benchmarks/trade_stress.py --threads 16 --orders 200
+
+Uses a scratch SQLite file unless DATABASE_URL is set (use a scratch Postgres
+database to exercise row locking there).
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "stress.db"))
+
+from app import app, db
+from models import User, Holding, Transaction
+from trades import TradeError, execute_buy, execute_sell, run_trade
+
+SYMBOLS = ["AAA", "BBB", "CCC"]
+STARTING_CASH = 10000.0
+
+
+def worker(user_id, orders, seed, counts, lock):
+    rng = random.Random(seed)
+    with app.app_context():
+        for _ in range(orders):
+            trade = rng.choice([execute_buy, execute_sell])
+            args = (user_id, rng.choice(SYMBOLS), rng.randint(1, 5), round(rng.uniform(50, 150), 2))
+            try:
+                run_trade(trade, *args)
+                outcome = "filled"
+            except TradeError:
+                outcome = "rejected"
+            except Exception:
+                outcome = "failed"
+            with lock:
+                counts[outcome] += 1
+        db.session.remove()
+
+
+def check(user_id):
+    """Return a list of invariant violations (empty if the books balance)."""
+    problems = []
+    user = db.session.get(User, user_id)
+    transactions = Transaction.query.filter(Transaction.user_id == user_id).all()
+
+    spent = sum(t.shares * t.price for t in transactions)
+    if abs(STARTING_CASH - spent - user.cash) > 0.01:
+        problems.append(f"cash {user.cash:.2f} != starting cash minus net spent {STARTING_CASH - spent:.2f}")
+    if user.cash < -0.01:
+        problems.append(f"negative cash {user.cash:.2f}")
+
+    for symbol in SYMBOLS:
+        rows = Holding.query.filter((Holding.user_id == user_id) & (Holding.symbol == symbol)).all()
+        expected = sum(t.shares for t in transactions if t.symbol == symbol)
+        held = sum(h.shares for h in rows)
+        if len(rows) > 1:
+            problems.append(f"{symbol}: {len(rows)} holding rows")
+        if held != expected:
+            problems.append(f"{symbol}: holding has {held} shares, transactions add up to {expected}")
+        if expected < 0:
+            problems.append(f"{symbol}: oversold to {expected} shares")
+
+    cost = sum(h.total_cost for h in Holding.query.filter(Holding.user_id == user_id)) - user.realized_gain
+    if abs(cost - spent) > 0.01:
+        problems.append(f"stored cost basis {cost:.2f} != transactions {spent:.2f}")
+
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--orders", type=int, default=200, help="orders per thread")
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username="stress", email="stress@example.com", password_hash="x", cash=STARTING_CASH)
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    counts = {"filled": 0, "rejected": 0, "failed": 0}
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=worker, args=(user_id, args.orders, seed, counts, lock))
+        for seed in range(args.threads)
+    ]
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total = args.threads * args.orders
+    print(f"{total} orders from {args.threads} threads in {elapsed:.2f}s ({total / elapsed:.0f} orders/s)")
+    print(f"filled {counts['filled']}, rejected {counts['rejected']}, failed after retries {counts['failed']}")
+
+    with app.app_context():
+        problems = check(user_id)
+
+    for problem in problems:
+        print("FAIL", problem)
+    print("books balance" if not problems else f"{len(problems)} problems")
+    sys.exit(1 if problems else 0)
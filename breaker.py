@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import deque
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream API while its circuit is open."""
+
+
+class CircuitBreaker:
+    """Stop calling a failing upstream API for a while, then probe it to recover.
+
+    Calls over the last BREAKER_WINDOW seconds are tracked. Once at least
+    BREAKER_MIN_CALLS were made and BREAKER_FAILURE_RATE of them failed (raised,
+    or took longer than BREAKER_SLOW_CALL seconds), the circuit opens and calls
+    fail fast for BREAKER_COOLDOWN seconds. Then a single probe call is let
+    through (half-open): success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, app=None):
+        self.name = name
+        self.window = 60
+        self.min_calls = 5
+        self.failure_rate = 0.5
+        self.slow_call = 5
+        self.cooldown = 30
+
+        self.state = self.CLOSED
+        self.trips = 0
+        self._calls = deque() # (time, ok)
+        self._opened_at = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.window = app.config.get("BREAKER_WINDOW", self.window)
+        self.min_calls = app.config.get("BREAKER_MIN_CALLS", self.min_calls)
+        self.failure_rate = app.config.get("BREAKER_FAILURE_RATE", self.failure_rate)
+        self.slow_call = app.config.get("BREAKER_SLOW_CALL", self.slow_call)
+        self.cooldown = app.config.get("BREAKER_COOLDOWN", self.cooldown)
+
+    def call(self, fn, *args, **kwargs):
+        """Call fn through the breaker, raising CircuitOpenError if it's open."""
+
+        probe = self._before_call()
+
+        started = time.monotonic()
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = time.monotonic() - started <= self.slow_call
+            return result
+        finally:
+            # Recorded (as a failure) even when the call is cancelled, like by a
+            # gevent.Timeout or GreenletExit, which would otherwise leave a
+            # half-open probe claimed for good
+            self._record(ok, probe)
+
+    def _before_call(self):
+        """Admit a call or raise CircuitOpenError; returns whether it's the half-open probe."""
+
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    raise CircuitOpenError(f"{self.name} circuit is open")
+                self.state = self.HALF_OPEN
+
+            if self.state == self.HALF_OPEN:
+                # Only one probe at a time while recovering
+                if self._probing:
+                    raise CircuitOpenError(f"{self.name} circuit is half open")
+                self._probing = True
+                return True
+
+            return False
+
+    def _record(self, ok, probe):
+        now = time.monotonic()
+
+        with self._lock:
+            if probe:
+                self._probing = False
+                if ok:
+                    self.state = self.CLOSED
+                    self._calls.clear()
+                else:
+                    self._open(now)
+                return
+
+            # A call let through before the circuit opened only counts while
+            # closed; after a trip it mustn't settle the probe's outcome
+            if self.state != self.CLOSED:
+                return
+
+            self._calls.append((now, ok))
+            while self._calls and self._calls[0][0] < now - self.window:
+                self._calls.popleft()
+
+            failures = sum(1 for _, call_ok in self._calls if not call_ok)
+            if len(self._calls) >= self.min_calls and failures / len(self._calls) >= self.failure_rate:
+                self._open(now)
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self.trips += 1
+        self._opened_at = now
+        self._calls.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "trips": self.trips,
+                "recent_calls": len(self._calls),
+                "recent_failures": sum(1 for _, ok in self._calls if not ok),
+            }
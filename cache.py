@@ -0,0 +1,456 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+
+
+# Expired quotes are kept around for this many TTLs so a later lookup can be
+# counted as "stale" (we had the symbol, just too old) rather than a cold miss
+STALE_FACTOR = 10
+
+
+class MemoryBackend:
+    """In-process LRU store (private to a single worker)."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires = entry
+            if expires < time.time():
+                del self._entries[key]
+                return None
+
+            # Mark as most recently used
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (value, time.time() + timeout)
+            self._entries.move_to_end(key)
+
+            # Evict least recently used entries once over the size bound
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class CachelibBackend:
+    """Adapter over a cachelib cache, used to share entries between gunicorn workers.
+
+    Size bounds are enforced by the underlying store: FileSystemCache prunes
+    past its threshold, and Redis should run with an allkeys-lru maxmemory policy.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, timeout):
+        self.cache.set(key, value, timeout=int(timeout))
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    def clear(self):
+        self.cache.clear()
+
+
+def make_backend(config, prefix, size=None):
+    """Build the storage backend named by QUOTE_CACHE_BACKEND.
+
+    Each cache gets its own store (a subdirectory of QUOTE_CACHE_DIR, or its
+    prefix on Redis), so caches don't evict or clear each other's entries.
+    size is the most entries kept (QUOTE_CACHE_SIZE by default).
+    """
+
+    kind = config.get("QUOTE_CACHE_BACKEND", "memory")
+    size = size or config.get("QUOTE_CACHE_SIZE", 1024)
+
+    if kind == "memory":
+        return MemoryBackend(max_entries=size)
+
+    if kind == "filesystem":
+        from cachelib import FileSystemCache
+        directory = os.path.join(config.get("QUOTE_CACHE_DIR"), prefix.rstrip(":"))
+        return CachelibBackend(FileSystemCache(directory, threshold=size))
+
+    if kind == "redis":
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("QUOTE_CACHE_BACKEND is 'redis' but the redis package is not installed")
+        from cachelib import RedisCache
+        return CachelibBackend(RedisCache(host=redis.from_url(config.get("REDIS_URL")), key_prefix=prefix))
+
+    raise RuntimeError(f"Unknown QUOTE_CACHE_BACKEND: {kind}")
+
+
+class QuoteCache:
+    """Per-symbol TTL cache in front of the quote API, with hit/miss/stale counters."""
+
+    def __init__(self, app=None):
+        self.ttl = 60
+        self.backend = MemoryBackend()
+        self._counts = {"hits": 0, "misses": 0, "stale": 0}
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get("QUOTE_CACHE_TTL", 60)
+        self.backend = make_backend(app.config, prefix="quote:")
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def get(self, symbol):
+        """Return cached quote for symbol, or None if missing or expired."""
+
+        entry = self.backend.get(symbol)
+
+        if entry is None:
+            self._count("misses")
+            return None
+
+        if entry["expires"] < time.time():
+            self._count("stale")
+            return None
+
+        self._count("hits")
+        return dict(entry["quote"])
+
+    def set(self, symbol, quote, ttl=None):
+        """Store quote for symbol, expiring after ttl seconds (defaults to QUOTE_CACHE_TTL)."""
+
+        ttl = self.ttl if ttl is None else ttl
+        entry = {"quote": dict(quote), "expires": time.time() + ttl}
+        self.backend.set(symbol, entry, ttl * STALE_FACTOR)
+
+    def stats(self):
+        """Counters for this worker, used to tune QUOTE_CACHE_TTL."""
+
+        with self._lock:
+            counts = dict(self._counts)
+
+        lookups = sum(counts.values())
+        counts["hit_rate"] = round(counts["hits"] / lookups, 4) if lookups else 0.0
+        counts["ttl"] = self.ttl
+        counts["backend"] = type(self.backend).__name__
+        return counts
+
+
+quote_cache = QuoteCache()
+
+
+class PriceSnapshot:
+    """Latest prices written by the background refresher, read first by lookup.
+
+    Also remembers recently quoted symbols so the refresher keeps them current
+    alongside everything held in portfolios (only while snapshots are used,
+    PRICE_SNAPSHOT_MAX_AGE or PRICE_REFRESH_INTERVAL set). With a shared
+    backend each worker merges its own into a shared list in the background
+    every few seconds, so a refresher in another process (flask
+    refresh-prices) sees them too.
+    """
+
+    # Seconds between merging this worker's recent symbols into the shared list
+    PUBLISH_INTERVAL = 5
+
+    def __init__(self, app=None):
+        self.max_age = 0
+        self.backend = MemoryBackend()
+        self._recent = OrderedDict()  # symbol -> time last quoted
+        self._recent_size = 256
+        self._publishing = False
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        interval = app.config.get("PRICE_REFRESH_INTERVAL", 0)
+        self.max_age = app.config.get("PRICE_SNAPSHOT_MAX_AGE") or interval * 2
+        self._recent_size = app.config.get("PRICE_REFRESH_RECENT", 256)
+        self.backend = make_backend(app.config, prefix="snapshot:")
+
+    @property
+    def shared(self):
+        return not isinstance(self.backend, MemoryBackend)
+
+    def get(self, symbol):
+        """Return snapshot quote for symbol, or None if absent or older than max_age."""
+
+        if not self.max_age:
+            return None
+
+        entry = self.backend.get(symbol)
+        if entry is None or time.time() - entry["refreshed"] > self.max_age:
+            return None
+        return dict(entry["quote"])
+
+    def age(self, symbol):
+        """Seconds since symbol was last refreshed (None if never)."""
+
+        entry = self.backend.get(symbol)
+        return None if entry is None else time.time() - entry["refreshed"]
+
+    def set(self, symbol, quote):
+        entry = {"quote": dict(quote), "refreshed": time.time()}
+        self.backend.set(symbol, entry, max(self.max_age, 1) * STALE_FACTOR)
+
+    def touch(self, symbol):
+        """Record that symbol was just quoted."""
+
+        # Nothing reads them without a refresher
+        if not self.max_age:
+            return
+
+        with self._lock:
+            self._recent[symbol] = time.time()
+            self._recent.move_to_end(symbol)
+            while len(self._recent) > self._recent_size:
+                self._recent.popitem(last=False)
+
+            # One write per PUBLISH_INTERVAL at most, off the request path
+            schedule = self.shared and not self._publishing
+            if schedule:
+                self._publishing = True
+
+        if schedule:
+            timer = threading.Timer(self.PUBLISH_INTERVAL, self.publish)
+            timer.daemon = True
+            timer.start()
+
+    def _merged(self):
+        """This worker's recent symbols merged with the shared list, most recent last."""
+
+        merged = dict(self.backend.get("_recent") or {}) if self.shared else {}
+        with self._lock:
+            for symbol, quoted in self._recent.items():
+                merged[symbol] = max(quoted, merged.get(symbol, 0))
+
+        return dict(sorted(merged.items(), key=lambda item: item[1])[-self._recent_size:])
+
+    def publish(self):
+        """Merge this worker's recent symbols into the shared list."""
+
+        # Workers can overwrite each other's merge, but each one keeps
+        # republishing its own symbols, so they're back within PUBLISH_INTERVAL
+        with self._lock:
+            self._publishing = False
+        self.backend.set("_recent", self._merged(), 86400)
+
+    def recent(self):
+        return list(self._merged())
+
+
+price_snapshot = PriceSnapshot()
+
+
+class NewsCache:
+    """Long-TTL cache for news articles, keyed by (query, days, count).
+
+    Concurrent misses for the same key in a worker wait on a single upstream
+    request, and expired entries keep being served while one background
+    refresh replaces them.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 1800
+        self.backend = MemoryBackend()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get("NEWS_CACHE_TTL", 1800)
+        self.backend = make_backend(app.config, prefix="news:")
+
+    def get(self, key, fetch):
+        """Return cached value for key, calling fetch() to fill or refresh it."""
+
+        name = "|".join(str(part) for part in key)
+        entry = self.backend.get(name)
+
+        if entry is not None:
+            # Serve stale entries straight away and refresh in the background
+            if entry["expires"] < time.time():
+                future, leader = self._claim(name)
+                if leader:
+                    threading.Thread(target=self._fill, args=(name, fetch, future), daemon=True).start()
+            return entry["value"]
+
+        # Miss: the first caller fetches, everyone else waits for its result
+        future, leader = self._claim(name)
+        if leader:
+            self._fill(name, fetch, future)
+        return future.result()
+
+    def _claim(self, name):
+        with self._lock:
+            future = self._inflight.get(name)
+            if future is not None:
+                return future, False
+            future = self._inflight[name] = Future()
+            return future, True
+
+    def _fill(self, name, fetch, future):
+        value = None
+        try:
+            value = fetch()
+            # Failed fetches aren't cached, so the next view retries
+            if value is not None:
+                entry = {"value": value, "expires": time.time() + self.ttl}
+                self.backend.set(name, entry, self.ttl * STALE_FACTOR)
+        finally:
+            with self._lock:
+                self._inflight.pop(name, None)
+            future.set_result(value)
+
+
+news_cache = NewsCache()
+
+
+class FragmentCache:
+    """Rendered HTML shared by every viewer of a page, keyed by name (like "quote:AAPL").
+
+    Each entry holds the page's shared parts (part name -> HTML, so per-user
+    parts can go in between), the data they were rendered from, an ETag of
+    their HTML and the time they were rendered, for conditional requests.
+    Entries last FRAGMENT_CACHE_TTL seconds; parts rendered from data that
+    changes more often (like a quote) are looked up with that data, and
+    only reused while it's unchanged.
+    """
+
+    def __init__(self, app=None):
+        self.ttl = 60
+        self.backend = MemoryBackend()
+        self._counts = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get("FRAGMENT_CACHE_TTL", 60)
+        # Two parts (quote header and news) per stock
+        self.backend = make_backend(app.config, prefix="fragment:", size=app.config.get("QUOTE_CACHE_SIZE", 1024) * 2)
+
+    def get(self, name, data=None):
+        """Return the cached entry (parts, data, etag, rendered_at) for name, or None if missing or expired.
+
+        If data is given, an entry rendered from different data is a miss too.
+        """
+
+        entry = self.backend.get(name)
+        hit = entry is not None and entry["expires"] >= time.time() and (data is None or entry["data"] == data)
+
+        with self._lock:
+            self._counts["hits" if hit else "misses"] += 1
+        return entry if hit else None
+
+    def set(self, name, parts, data=None):
+        """Store parts rendered from data under name. Returns the entry (only built, not kept, with a TTL of 0)."""
+
+        entry = {
+            "parts": parts,
+            "data": data,
+            "etag": hashlib.sha1("".join(parts.values()).encode()).hexdigest(),
+            # HTTP dates have whole seconds
+            "rendered_at": datetime.utcnow().replace(microsecond=0),
+            "expires": time.time() + self.ttl,
+        }
+        if self.ttl > 0:
+            self.backend.set(name, entry, self.ttl)
+        return entry
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+
+        lookups = sum(counts.values())
+        counts["hit_rate"] = round(counts["hits"] / lookups, 4) if lookups else 0.0
+        counts["ttl"] = self.ttl
+        return counts
+
+
+fragment_cache = FragmentCache()
+
+
+class LastPriceStore:
+    """Last successfully fetched quote per symbol, persisted on disk.
+
+    Served (flagged as stale) when the stock API is failing or its circuit
+    breaker is open, so pages still show a price.
+    """
+
+    AS_OF_RESOLUTION = 60 # Seconds
+    WRITTEN_SIZE = 1024
+
+    def __init__(self, app=None):
+        from cachelib import SimpleCache
+        self.cache = SimpleCache(threshold=1024, default_timeout=0)
+        self._written = OrderedDict() # symbol -> (price, time) last written by this worker
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from cachelib import FileSystemCache
+        self.cache = FileSystemCache(app.config.get("LAST_PRICE_DIR"), threshold=app.config.get("LAST_PRICE_SIZE", 0), default_timeout=0)
+
+    def get(self, symbol):
+        """Return last known quote for symbol flagged as stale, or None."""
+
+        entry = self.cache.get(symbol)
+        if entry is None:
+            return None
+
+        quote = dict(entry["quote"])
+        quote["stale"] = True
+        quote["as_of"] = entry["as_of"]
+        return quote
+
+    def set(self, symbol, quote):
+        # Quotes are fetched far more often than prices change, so an unchanged
+        # price only goes to disk once its as_of is AS_OF_RESOLUTION old
+        now = time.time()
+        with self._lock:
+            written = self._written.get(symbol)
+            if written and written[0] == quote["price"] and now - written[1] < self.AS_OF_RESOLUTION:
+                return
+            self._written[symbol] = (quote["price"], now)
+            self._written.move_to_end(symbol)
+            while len(self._written) > self.WRITTEN_SIZE:
+                self._written.popitem(last=False)
+
+        self.cache.set(symbol, {"quote": dict(quote), "as_of": datetime.utcnow()})
+
+
+last_prices = LastPriceStore()
@@ -10,7 +10,104 @@ class Config:
     # Fix database URI for Postgresql and SQLAlchemy for Heroku
     if SQLALCHEMY_DATABASE_URI is not None and SQLALCHEMY_DATABASE_URI.startswith("postgres://"):
         SQLALCHEMY_DATABASE_URI = SQLALCHEMY_DATABASE_URI.replace("postgres://", "postgresql://", 1)
-    
+
+    # Database connections per worker (raise for the gevent serving profile,
+    # which handles many requests at once in each worker)
+    if SQLALCHEMY_DATABASE_URI is not None and SQLALCHEMY_DATABASE_URI.startswith("postgresql"):
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            "pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+            "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 10)),
+        }
+
+    # Quote cache: "memory" is per worker, "filesystem" and "redis" are shared between workers
+    QUOTE_CACHE_BACKEND = os.getenv("QUOTE_CACHE_BACKEND", "memory")
+    QUOTE_CACHE_TTL = int(os.getenv("QUOTE_CACHE_TTL", 60)) # Seconds
+    QUOTE_CACHE_SIZE = int(os.getenv("QUOTE_CACHE_SIZE", 1024)) # Max symbols kept
+    QUOTE_CACHE_DIR = os.getenv("QUOTE_CACHE_DIR", "/tmp/paper-trader-cache") # One subdirectory per cache
+    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+    # Source of stock prices: yahoo, iex (needs IEX_API_KEY) or replay (serves
+    # REPLAY_DATA_PATH, a CSV or Parquet file with Symbol, Date and Close columns,
+    # advancing one day every REPLAY_INTERVAL seconds, 0 stays on the latest day)
+    MARKET_DATA_PROVIDER = os.getenv("MARKET_DATA_PROVIDER", "yahoo")
+    REPLAY_DATA_PATH = os.getenv("REPLAY_DATA_PATH")
+    REPLAY_INTERVAL = float(os.getenv("REPLAY_INTERVAL", 0)) # Seconds
+
+    # Daily price bars downloaded from the provider are kept here (empty disables it)
+    BAR_STORE_DIR = os.getenv("BAR_STORE_DIR", "/tmp/paper-trader-bars")
+
+    # Upstream APIs (override to point at a local stub server)
+    IEX_API_URL = os.getenv("IEX_API_URL", "https://cloud.iexapis.com")
+    YAHOO_API_URL = os.getenv("YAHOO_API_URL", "https://query1.finance.yahoo.com")
+    NEWS_API_URL = os.getenv("NEWS_API_URL", "https://newsapi.org")
+
+    # Pooled HTTP client for the APIs: pool size is per worker process and also
+    # sets how many quotes lookup_many fetches at once
+    HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 8))
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3.05)) # Seconds
+    HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 10)) # Seconds
+    HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 2))
+    HTTP_RETRY_BACKOFF = float(os.getenv("HTTP_RETRY_BACKOFF", 0.3)) # Seconds, doubled on each retry
+
+    # Circuit breaker for the stock API: opens when BREAKER_FAILURE_RATE of the calls
+    # in the last BREAKER_WINDOW seconds fail or take over BREAKER_SLOW_CALL seconds,
+    # then probes again after BREAKER_COOLDOWN seconds. Meanwhile the last known
+    # prices (kept in LAST_PRICE_DIR) are shown, flagged as delayed
+    BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", 60)) # Seconds
+    BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", 5))
+    BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", 0.5))
+    BREAKER_SLOW_CALL = float(os.getenv("BREAKER_SLOW_CALL", 5)) # Seconds
+    BREAKER_COOLDOWN = int(os.getenv("BREAKER_COOLDOWN", 30)) # Seconds
+    LAST_PRICE_DIR = os.getenv("LAST_PRICE_DIR", "/tmp/paper-trader-last-prices")
+    LAST_PRICE_SIZE = int(os.getenv("LAST_PRICE_SIZE", 0)) # Max symbols kept (0 for no limit)
+
+    # Background price refresher (0 disables it). Snapshot prices are used by
+    # lookup for up to PRICE_SNAPSHOT_MAX_AGE seconds (default twice the interval)
+    PRICE_REFRESH_INTERVAL = int(os.getenv("PRICE_REFRESH_INTERVAL", 0)) # Seconds
+    PRICE_SNAPSHOT_MAX_AGE = int(os.getenv("PRICE_SNAPSHOT_MAX_AGE", 0)) # Seconds
+    PRICE_REFRESH_RECENT = int(os.getenv("PRICE_REFRESH_RECENT", 256)) # Recently quoted symbols kept current
+
+    # SQL statements per request: optional X-SQL-Statements header, and a budget
+    # above which requests are logged (0 disables the check)
+    SQL_COUNT_HEADER = os.getenv("SQL_COUNT_HEADER", "") == "1"
+    SQL_STATEMENT_BUDGET = int(os.getenv("SQL_STATEMENT_BUDGET", 0))
+
+    # Latency histograms at /metrics (Prometheus format, off by default as it's public
+    # unless METRICS_TOKEN is set), and an optional Server-Timing header with each
+    # request's SQL, API and render time
+    METRICS_ENDPOINT = os.getenv("METRICS_ENDPOINT", "0") == "1"
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN") # Scrapers send "Authorization: Bearer <token>"
+    SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "") == "1"
+
+    # Most orders accepted in one basket order request
+    BASKET_MAX_ORDERS = int(os.getenv("BASKET_MAX_ORDERS", 100))
+
+    # Most open limit and stop orders per user
+    ORDERS_MAX_OPEN = int(os.getenv("ORDERS_MAX_OPEN", 100))
+
+    # Transactions shown per page of history
+    HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 50))
+
+    # Users shown on the leaderboard
+    LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", 100))
+
+    # Annual risk-free rate used for the Sharpe ratio in portfolio analytics
+    ANALYTICS_RISK_FREE_RATE = float(os.getenv("ANALYTICS_RISK_FREE_RATE", 0))
+
+    # News articles are cached per stock; expired entries are served while refreshing
+    NEWS_CACHE_TTL = int(os.getenv("NEWS_CACHE_TTL", 1800)) # Seconds
+
+    # How long the quote page waits for news before rendering without it
+    NEWS_TIMEOUT = float(os.getenv("NEWS_TIMEOUT", 2)) # Seconds
+
+    # Rendered quote and news HTML shared by every viewer of a stock (the quote part is
+    # only reused while the quote is unchanged; news, or its absence while the News API
+    # fails, is shown for this long)
+    FRAGMENT_CACHE_TTL = int(os.getenv("FRAGMENT_CACHE_TTL", QUOTE_CACHE_TTL)) # Seconds
+
+    # Deadline for pricing stocks (portfolio and quote pages, basket orders)
+    QUOTE_BATCH_TIMEOUT = float(os.getenv("QUOTE_BATCH_TIMEOUT", 10)) # Seconds
+
 class ProductionConfig(Config):
     pass
 
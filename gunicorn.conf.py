@@ -0,0 +1,24 @@
+# Gunicorn settings (loaded automatically from the working directory)
+import os
+
+# Serving profile:
+#   "sync"    - one request at a time per worker (default)
+#   "gthread" - GUNICORN_THREADS requests at a time per worker (Gunicorn also
+#               switches "sync" to this when GUNICORN_THREADS > 1)
+#   "gevent"  - cooperative I/O, up to GUNICORN_WORKER_CONNECTIONS requests per
+#               worker; requests and psycopg2 yield while waiting on the stock
+#               and news APIs or the database instead of blocking the worker
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+workers = int(os.getenv("WEB_CONCURRENCY", 3))
+threads = int(os.getenv("GUNICORN_THREADS", 1))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 100))
+
+# Don't let a stalled upstream hold a worker forever
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+
+
+def post_fork(server, worker):
+    # Make psycopg2 cooperate with gevent (no-op for other profiles)
+    if worker_class == "gevent":
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
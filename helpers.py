@@ -1,15 +1,119 @@
 import os
 import requests
+import threading
 import urllib.parse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from flask import redirect, render_template, request, session
 from functools import wraps
 
-import csv
-from datetime import datetime, timedelta
-import pytz
+import json
+from concurrent.futures import TimeoutError, wait
+from datetime import date, datetime, timedelta
+import time
 import uuid
 
+from bars import bar_store, bars_to_columns, last_trading_day
+from breaker import CircuitBreaker, CircuitOpenError
+from cache import last_prices, news_cache, price_snapshot, quote_cache
+from instrumentation import ContextExecutor, metrics
+from providers import ProviderError, YahooProvider, make_provider, quote_from_closes
+
+
+class MarketDataClient:
+    """Keep-alive HTTP client shared by the stock and news API helpers.
+
+    Each process lazily builds its own pooled requests.Session and lookup
+    thread pool, since neither can be shared across Gunicorn's fork. Stock
+    prices come from the provider named by MARKET_DATA_PROVIDER.
+    """
+
+    def __init__(self, app=None):
+        self.provider = YahooProvider(self)
+        self.news_url = "https://newsapi.org"
+        self.pool_size = 8
+        self.timeout = (3.05, 10) # (connect, read) in seconds
+        self.retries = 2
+        self.backoff = 0.3
+        self._pid = None
+        self._session = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.news_url = app.config.get("NEWS_API_URL", self.news_url).rstrip("/")
+        self.pool_size = app.config.get("HTTP_POOL_SIZE", self.pool_size)
+        self.timeout = (app.config.get("HTTP_CONNECT_TIMEOUT", 3.05), app.config.get("HTTP_READ_TIMEOUT", 10))
+        self.retries = app.config.get("HTTP_RETRIES", self.retries)
+        self.backoff = app.config.get("HTTP_RETRY_BACKOFF", self.backoff)
+        self.provider = make_provider(app.config, self)
+
+    def _build(self):
+        # Retry connection errors and throttling/server errors with exponential backoff.
+        # Not read timeouts: a stalled upstream would hold the request for a multiple
+        # of HTTP_READ_TIMEOUT, past Gunicorn's worker timeout with the defaults.
+        retry = Retry(
+            total=self.retries,
+            read=0,
+            backoff_factor=self.backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+            raise_on_status=False,
+        )
+
+        # One pool per upstream host, each big enough for every lookup thread
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({"User-Agent": "python-requests", "Accept": "*/*"})
+        session.cookies.set("session", str(uuid.uuid4()))
+
+        self._session = session
+        self._executor = ContextExecutor(max_workers=self.pool_size, thread_name_prefix="lookup")
+        self._pid = os.getpid()
+
+    def _ensure(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._build()
+
+    @property
+    def session(self):
+        self._ensure()
+        return self._session
+
+    @property
+    def executor(self):
+        self._ensure()
+        return self._executor
+
+    def get(self, url, **kwargs):
+        """GET url over the pooled session, with default timeouts."""
+
+        kwargs.setdefault("timeout", self.timeout)
+        started = time.perf_counter()
+        try:
+            return self.session.get(url, **kwargs)
+        finally:
+            metrics.record("upstream_request_duration_seconds", "upstream", time.perf_counter() - started,
+                           host=urllib.parse.urlsplit(url).netloc)
+
+
+market_data = MarketDataClient()
+
+# Circuit breaker around the stock API
+quote_breaker = CircuitBreaker("quotes")
+
+
+class QuoteUnavailable(Exception):
+    """Stock API is failing or its circuit is open (as opposed to an unknown symbol)."""
+
 
 # def login_required(f):
 #     """
@@ -25,92 +129,234 @@ import uuid
 #     return decorated_function
 
 
+def cached_quote(symbol):
+    """Quote for symbol from the refresher's snapshot or the quote cache, or None."""
+
+    quote = price_snapshot.get(symbol)
+    if quote is None:
+        quote = quote_cache.get(symbol)
+    return quote
+
+
+@metrics.timed("lookup")
 def lookup(symbol):
     """Look up quote for symbol."""
-    
-    # Prepare API request
+
+    symbol = symbol.upper()
+
+    # Prefer the background refresher's snapshot, then recently cached quotes
+    quote = cached_quote(symbol)
+
+    if quote is None:
+        try:
+            quote = fetch_quote(symbol)
+        except QuoteUnavailable:
+            # Fall back to the last known price, flagged as stale
+            return last_prices.get(symbol)
+
+        if quote is None:
+            return None
+        quote_cache.set(symbol, quote)
+
+    # Keep symbol in the refresher's working set
+    price_snapshot.touch(symbol)
+    return quote
+
+
+def fetch_quote(symbol):
+    """Fetch quote for symbol from the market data provider (bypassing any cache).
+
+    Returns None for unknown symbols, raises QuoteUnavailable if the provider is failing.
+    """
+
     symbol = symbol.upper()
-    end = datetime.now(pytz.timezone("US/Eastern"))
-    start = end - timedelta(days=7)
-
-    # Yahoo Finance API
-    url = (
-        f"https://query1.finance.yahoo.com/v7/finance/download/{urllib.parse.quote_plus(symbol)}"
-        f"?period1={int(start.timestamp())}"
-        f"&period2={int(end.timestamp())}"
-        f"&interval=1d&events=history&includeAdjustedClose=true"
-    )
-
-    # Query API
+
+    # Keep the downloaded bars instead of throwing away all but two closes
+    # (only for providers whose quotes are built from those closes anyway)
+    provider = market_data.provider
+    if bar_store.enabled and provider.remote and provider.quotes_from_history:
+        fetch = fetch_quote_bars
+    else:
+        fetch = provider.quote
+
     try:
-        response = requests.get(url, cookies={"session": str(uuid.uuid4())}, headers={"User-Agent": "python-requests", "Accept": "*/*"})
-        response.raise_for_status()
+        quote = quote_breaker.call(fetch, symbol)
+    except (CircuitOpenError, ProviderError) as e:
+        raise QuoteUnavailable(str(e)) from e
+
+    # Keep as last known price in case the provider goes down
+    if quote is not None:
+        last_prices.set(symbol, quote)
+    return quote
+
 
-        # CSV header: Date,Open,High,Low,Close,Adj Close,Volume
-        # Creates a list of dictionaries, with each dictionary a day's data
-        quotes = list(csv.DictReader(response.content.decode("utf-8").splitlines()))
-        quotes.reverse()
-        
-        oldPr = float(quotes[1]["Adj Close"])
-        closePr = float(quotes[0]["Adj Close"])
-        
-        price = round(closePr, 2)
-        change = round(closePr - oldPr, 2)
-        change_percent = round(((closePr - oldPr) / oldPr) * 100, 2)
-        
-        return {
-            "name": symbol,
-            "price": price,
-            "symbol": symbol,
-            "change": change,
-            "change_percent": change_percent
-        }
-    except (requests.RequestException, ValueError, KeyError, IndexError):
+def fetch_quote_bars(symbol):
+    """Download the bars missing from the bar store and build the quote from the stored closes."""
+
+    today = date.today()
+    last = bar_store.last_date(symbol)
+
+    # Only the days since the newest stored bar (refetched, it may have been
+    # mid-session), or a week for symbols not stored yet
+    days = (today - last).days + 1 if last else 7
+    bars = market_data.provider.history(symbol, days=days)
+    if not bars:
         return None
 
-    # IEX no longer used due to paywall
-    # # Make IEX API request
-    # try:
-    #     api_key = os.getenv("IEX_API_KEY")
-    #     url = f"https://cloud.iexapis.com/stable/stock/{urllib.parse.quote_plus(symbol)}/quote?token={api_key}"
-    #     response = requests.get(url)
-    #     response.raise_for_status()
-    # except requests.RequestException:
-    #     return None
-
-    # # Parse response
-    # try:
-    #     quote = response.json()
-    #     return {
-    #         "name": quote["companyName"],
-    #         "price": float(quote["latestPrice"]),
-    #         "symbol": quote["symbol"],
-    #         "change": float(quote["change"]),
-    #         "change_percent": float(quote["changePercent"])
-    #     }
-    # except (KeyError, TypeError, ValueError):
-    #     return None
+    bar_store.merge(symbol, bars, since=today - timedelta(days=days), checked=today)
+    return quote_from_closes(symbol, bar_store.columns(symbol)["close"][-2:])
+
+
+def fetch_quotes(symbols):
+    """Fetch quotes for several symbols in one provider request (bypassing any cache).
+
+    Returns a dict of symbol -> quote (None for unknown symbols), raises
+    QuoteUnavailable if the provider is failing.
+    """
 
+    symbols = [symbol.upper() for symbol in symbols]
+
+    try:
+        quotes = quote_breaker.call(market_data.provider.quotes, symbols)
+    except (CircuitOpenError, ProviderError) as e:
+        raise QuoteUnavailable(str(e)) from e
+
+    for symbol, quote in quotes.items():
+        if quote is not None:
+            last_prices.set(symbol, quote)
+    return quotes
+
+
+def lookup_many(symbols, timeout=10):
+    """Look up quotes for several symbols concurrently.
+
+    Returns a dict of symbol -> quote. Symbols that fail or miss the overall
+    deadline (in seconds) map to None instead of holding up the others.
+    """
+
+    # Drop duplicates while keeping order
+    symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+
+    if market_data.provider.batch:
+        return lookup_batch(symbols, timeout=timeout)
+
+    futures = {symbol: market_data.executor.submit(lookup, symbol) for symbol in symbols}
+    done, not_done = wait(futures.values(), timeout=timeout)
+
+    # Don't start requests for symbols still queued after the deadline
+    for future in not_done:
+        future.cancel()
+
+    quotes = {}
+    for symbol, future in futures.items():
+        if future in done and future.exception() is None:
+            quotes[symbol] = future.result()
+        else:
+            quotes[symbol] = None
+
+    return quotes
+
+
+def lookup_batch(symbols, timeout=10):
+    """Look up quotes for symbols, fetching all uncached ones in one provider request.
+
+    Symbols are None if the request misses the deadline (in seconds).
+    """
+
+    quotes = {symbol: cached_quote(symbol) for symbol in symbols}
+    missing = [symbol for symbol, quote in quotes.items() if quote is None]
+
+    if missing:
+        future = market_data.executor.submit(fetch_quotes, missing)
+        try:
+            fetched = future.result(timeout=timeout)
+        except QuoteUnavailable:
+            # Fall back to the last known prices, flagged as stale
+            fetched = {symbol: last_prices.get(symbol) for symbol in missing}
+        except TimeoutError:
+            fetched = {}
+
+        for symbol in missing:
+            quote = quotes[symbol] = fetched.get(symbol)
+            if quote is not None and not quote.get("stale"):
+                quote_cache.set(symbol, quote)
+
+    for symbol in symbols:
+        if quotes[symbol] is not None:
+            price_snapshot.touch(symbol)
+
+    return quotes
+
+
+def get_history(symbol, days=365):
+    """Daily bars of symbol over the last days, as a dict of NumPy columns (see bars.COLUMNS).
+
+    Served from the bar store, downloading only history it doesn't have yet.
+    If the provider is down, whatever is stored is returned (nothing without
+    the bar store).
+    """
+
+    symbol = symbol.upper()
+    provider = market_data.provider
+    today = date.today()
+    start = today - timedelta(days=days)
+
+    if not bar_store.enabled or not provider.remote:
+        try:
+            return bars_to_columns(quote_breaker.call(provider.history, symbol, days) or [])
+        except (CircuitOpenError, ProviderError):
+            return bars_to_columns([])
+
+    covered = bar_store.covered_since(symbol)
+    last = bar_store.last_date(symbol)
+    checked = bar_store.checked_on(symbol)
+
+    try:
+        # Backfill the whole range if it starts before the stored history
+        if covered is None or covered > start:
+            since = start
+        # Otherwise top up the days since the newest stored bar, unless the
+        # provider was already asked since the last trading day (weekends,
+        # holidays and symbols without any bars have nothing newer)
+        elif max(day for day in (covered, last, checked) if day) < last_trading_day(today):
+            since = last or covered
+        else:
+            since = None
+
+        # Stored even if there are no bars (unknown symbols), so they aren't asked for again
+        if since is not None:
+            bars = quote_breaker.call(provider.history, symbol, (today - since).days + 1) or []
+            bar_store.merge(symbol, bars, since=since, checked=today)
+    except (CircuitOpenError, ProviderError):
+        pass
+
+    return bar_store.range(symbol, start=start)
+
+
+@metrics.timed("get_news")
 def get_news(query, days=7, count=4):
-    """Get news articles based on query."""
+    """Get news articles based on query (cached)."""
 
-    # Make News API request
+    return news_cache.get((query, days, count), lambda: fetch_news(query, days, count))
+
+
+def fetch_news(query, days=7, count=4):
+    """Fetch news articles based on query from the News API (bypassing the cache)."""
+
+    # Make News API request (only asking for the articles we show)
     try:
         api_key = os.getenv("NEWS_API_KEY")
         date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
-        url = f"https://newsapi.org/v2/everything?q={urllib.parse.quote_plus(query)}&from={date}&sortBy=popularity&apiKey={api_key}"
-        response = requests.get(url)
+        url = f"{market_data.news_url}/v2/everything?q={urllib.parse.quote_plus(query)}&from={date}&sortBy=popularity&pageSize={count}&apiKey={api_key}"
+        response = market_data.get(url)
         response.raise_for_status()
     except requests.RequestException:
         return None
 
     # Parse response
     try:
-        response1 = response.json()
-        response2 = response1["articles"]
-        response3 = response2[:count] # Slice fisrt N elements of list 
         articles = []
-        for item in response3:
+        for item in first_articles(response.text, count):
             # News API gives date and time: 2021-06-12T00:05:00Z
             date = item["publishedAt"].replace("T", " ").replace("Z", "")
 
@@ -125,10 +371,34 @@ def get_news(query, days=7, count=4):
             articles.append(article)
 
         return articles
-    except (KeyError, TypeError, ValueError):
+    except (KeyError, TypeError, ValueError, IndexError):
         return None
 
 
+def first_articles(text, count):
+    """Decode only the first count articles of a News API response body.
+
+    Walks the "articles" array one object at a time instead of decoding the
+    whole document.
+    """
+
+    decoder = json.JSONDecoder()
+    position = text.index("[", text.index('"articles"')) + 1
+    articles = []
+
+    while len(articles) < count:
+        # Skip separators between array items
+        while text[position] in " \t\r\n,":
+            position += 1
+        if text[position] == "]":
+            break
+
+        article, position = decoder.raw_decode(text, position)
+        articles.append(article)
+
+    return articles
+
+
 def usd(value):
     """Format value as USD."""
     return f"${value:,.2f}"
@@ -0,0 +1,239 @@
+import bisect
+import contextvars
+import hmac
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+import jinja2
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# (name, seconds) of everything timed for the current request, for the Server-Timing header
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.sql_statements = g.get("sql_statements", 0) + 1
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _time_statement(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is not None:
+        metrics.record("sql_statement_duration_seconds", "sql", time.perf_counter() - started)
+
+
+def sql_statements():
+    """Number of SQL statements run so far in the current request."""
+    return g.get("sql_statements", 0)
+
+
+class SQLCounter:
+    """Count SQL statements per request to catch N+1 query regressions.
+
+    Adds an X-SQL-Statements response header when SQL_COUNT_HEADER is set.
+    Requests running more than SQL_STATEMENT_BUDGET statements are logged,
+    and fail outright under TESTING so a regression breaks the test run.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.header = app.config.get("SQL_COUNT_HEADER", False)
+        self.budget = app.config.get("SQL_STATEMENT_BUDGET", 0)
+        self.testing = app.testing
+        app.after_request(self.after_request)
+
+    def after_request(self, response):
+        count = sql_statements()
+
+        if self.header:
+            response.headers["X-SQL-Statements"] = str(count)
+
+        if self.budget and count > self.budget:
+            message = f"{count} SQL statements in one request (budget is {self.budget})"
+            if self.testing:
+                raise AssertionError(message)
+            logger.warning(message)
+
+        return response
+
+
+sql_counter = SQLCounter()
+
+
+class Histogram:
+    """Counts of observed durations per bucket (cumulative when exported, as Prometheus expects)."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += seconds
+
+
+class ContextExecutor(ThreadPoolExecutor):
+    """Thread pool running each task in a copy of the submitting thread's context,
+    so work a request hands to the pool still counts towards its timings."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class TimedTemplate(jinja2.Template):
+    """Jinja template timing each render (extended layouts and includes count towards it)."""
+
+    def render(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            metrics.record("template_render_duration_seconds", "render", time.perf_counter() - started, template=self.name or "")
+
+
+class Metrics:
+    """Latency histograms per route, stock and news API call, SQL statement and template.
+
+    Served in the Prometheus text format at /metrics when METRICS_ENDPOINT is
+    on (only to requests bearing METRICS_TOKEN, if set), and totals per request in a Server-Timing header when
+    SERVER_TIMING_HEADER is set (shown by browser dev tools). Each process
+    keeps its own numbers, so scrape each Gunicorn worker. Recording is a
+    dictionary lookup and a bucket increment, cheap enough to leave on.
+    """
+
+    def __init__(self, app=None):
+        self.histograms = {}
+        self.server_timing = False
+        self.token = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.server_timing = app.config.get("SERVER_TIMING_HEADER", False)
+        self.token = app.config.get("METRICS_TOKEN")
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.jinja_env.template_class = TimedTemplate
+
+        if app.config.get("METRICS_ENDPOINT", False):
+            app.add_url_rule("/metrics", "metrics", self.export)
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram())
+        histogram.observe(seconds)
+
+    def record(self, name, timing, seconds, **labels):
+        """Observe seconds in histogram name, and add them to the request's timing (Server-Timing name)."""
+
+        self.observe(name, seconds, **labels)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((timing, seconds))
+
+    def timed(self, call):
+        """Decorate a function to record its duration as call."""
+
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return f(*args, **kwargs)
+                finally:
+                    self.record("call_duration_seconds", call, time.perf_counter() - started, call=call)
+            return decorated_function
+        return decorator
+
+    def before_request(self):
+        g.request_started = time.perf_counter()
+        _request_timings.set([])
+
+    def after_request(self, response):
+        started = g.pop("request_started", None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+
+        # Label by route pattern (not URL), so symbols don't each get their own series
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        self.observe("http_request_duration_seconds", elapsed, method=request.method, route=route, status=str(response.status_code))
+
+        if self.server_timing:
+            totals = {}
+            for name, seconds in _request_timings.get() or ():
+                total, count = totals.get(name, (0.0, 0))
+                totals[name] = (total + seconds, count + 1)
+
+            # Calls on the lookup thread pool overlap, so their total can exceed the request's
+            entries = [f'{name};dur={total * 1000:.1f};desc="{count} call{"s" if count != 1 else ""}"'
+                       for name, (total, count) in totals.items()]
+            entries.append(f"total;dur={elapsed * 1000:.1f}")
+            response.headers["Server-Timing"] = ", ".join(entries)
+
+        return response
+
+    def export(self):
+        """All histograms in the Prometheus text exposition format"""
+
+        if self.token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {self.token}"):
+            return Response("Forbidden", status=403, mimetype="text/plain")
+
+        def labels(pairs):
+            if not pairs:
+                return ""
+            return "{" + ",".join('{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"')) for key, value in pairs) + "}"
+
+        # Snapshot first, as requests keep adding series and observations
+        with self._lock:
+            histograms = list(self.histograms.items())
+        snapshot = {}
+        for key, histogram in histograms:
+            with histogram._lock:
+                snapshot[key] = (histogram.buckets, list(histogram.counts), histogram.sum)
+
+        lines = []
+        for name in sorted(set(name for name, _ in snapshot)):
+            lines.append(f"# TYPE {name} histogram")
+
+            for (series, pairs), (buckets, counts, total) in sorted(snapshot.items()):
+                if series != name:
+                    continue
+
+                cumulative = 0
+                for bound, count in zip(buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{labels(pairs + (('le', bound),))} {cumulative}")
+                lines.append(f"{name}_sum{labels(pairs)} {total}")
+                lines.append(f"{name}_count{labels(pairs)} {cumulative}")
+
+        return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+metrics = Metrics()
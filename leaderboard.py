@@ -0,0 +1,67 @@
+from datetime import datetime
+
+from sqlalchemy import case, func, literal, select
+
+from app import db
+from helpers import lookup_many
+from models import User, Holding, LeaderboardEntry, LeaderboardPrice
+
+# The leaderboard is rebuilt by a batch job (flask update-leaderboard) into its
+# own table, so serving it never prices anything. Each held stock is priced
+# once, then one grouped query values every user's holdings in the database.
+
+
+def update_leaderboard(timeout=60):
+    """Rebuild the leaderboard table. Returns the number of users ranked."""
+
+    now = datetime.utcnow()
+
+    # Price every distinct held stock once
+    symbols = [symbol for (symbol,) in db.session.query(Holding.symbol).distinct()]
+    quotes = lookup_many(symbols, timeout=timeout)
+
+    # Last known prices (stock API down) could be days old, those stocks count at cost instead
+    LeaderboardPrice.query.delete(synchronize_session=False)
+    prices = [{"symbol": symbol, "price": quotes[symbol.upper()]["price"]}
+              for symbol in symbols if quotes.get(symbol.upper()) is not None and not quotes[symbol.upper()].get("stale")]
+    if prices:
+        db.session.execute(LeaderboardPrice.__table__.insert(), prices)
+
+    # Value and cost of each user's holdings (stocks that couldn't be priced count at cost)
+    holdings = select(
+        Holding.user_id.label("user_id"),
+        func.sum(func.coalesce(Holding.shares * LeaderboardPrice.price, Holding.total_cost)).label("value"),
+        func.sum(Holding.total_cost).label("cost"),
+    ).select_from(Holding) \
+        .outerjoin(LeaderboardPrice, LeaderboardPrice.symbol == Holding.symbol) \
+        .group_by(Holding.user_id) \
+        .subquery()
+
+    holdings_value = func.coalesce(holdings.c.value, 0)
+    total_value = User.cash + holdings_value
+    # Starting cash: what's left plus the net cost of every trade (see app.portfolio)
+    invested = User.cash + func.coalesce(holdings.c.cost, 0) - User.realized_gain
+    total_return = case((invested > 0, total_value / invested - 1), else_=literal(0.0))
+
+    ranked = select(
+        User.id,
+        User.username,
+        User.cash,
+        holdings_value,
+        total_value,
+        invested,
+        total_return,
+        func.rank().over(order_by=total_value.desc()),
+        func.rank().over(order_by=total_return.desc()),
+        literal(now),
+    ).select_from(User).outerjoin(holdings, holdings.c.user_id == User.id)
+
+    # Swap in the new ranking in one transaction (readers keep the old one until commit)
+    LeaderboardEntry.query.delete(synchronize_session=False)
+    result = db.session.execute(LeaderboardEntry.__table__.insert().from_select([
+        "user_id", "username", "cash", "holdings_value", "total_value", "invested",
+        "total_return", "value_rank", "return_rank", "updated_at",
+    ], ranked))
+    db.session.commit()
+
+    return result.rowcount
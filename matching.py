@@ -0,0 +1,216 @@
+import heapq
+import logging
+import threading
+import time
+from datetime import datetime
+
+import click
+from sqlalchemy import select
+
+from app import db
+from helpers import lookup_many
+from models import Order
+from trades import TradeError, execute_buy, execute_sell, run_trade
+
+logger = logging.getLogger(__name__)
+
+
+class OrderBook:
+    """Resting limit and stop orders of one symbol, in two heaps by trigger price.
+
+    Buy limits and sell stops trigger once the price falls to their price,
+    so they're kept highest first; sell limits and buy stops trigger once it
+    rises to theirs, kept lowest first. A price update pops only the crossed
+    orders off the tops of the heaps, O(log n) per triggered order and O(1)
+    when nothing is crossed. Removed orders are dropped lazily as they reach
+    the top (or when they make up most of the heaps).
+    """
+
+    def __init__(self):
+        self.falling = []  # (-price, order id)
+        self.rising = []   # (price, order id)
+        self.live = set()
+
+    def __len__(self):
+        return len(self.live)
+
+    def add(self, order_id, side, kind, price):
+        if order_id in self.live:
+            return
+        self.live.add(order_id)
+
+        if (side == "buy") == (kind == "limit"):
+            heapq.heappush(self.falling, (-price, order_id))
+        else:
+            heapq.heappush(self.rising, (price, order_id))
+
+    def remove(self, order_id):
+        self.live.discard(order_id)
+
+        if len(self.falling) + len(self.rising) > 2 * len(self.live) + 1024:
+            self.falling = [entry for entry in self.falling if entry[1] in self.live]
+            self.rising = [entry for entry in self.rising if entry[1] in self.live]
+            heapq.heapify(self.falling)
+            heapq.heapify(self.rising)
+
+    def crossed(self, price):
+        """Remove and return the ids of orders triggered at price (at the same price, earliest placed first)."""
+
+        ids = []
+        while self.falling and -self.falling[0][0] >= price:
+            ids.append(heapq.heappop(self.falling)[1])
+        while self.rising and self.rising[0][0] <= price:
+            ids.append(heapq.heappop(self.rising)[1])
+
+        triggered = [order_id for order_id in ids if order_id in self.live]
+        self.live.difference_update(triggered)
+        return triggered
+
+
+def fill_order(order_id, price):
+    """Claim an open order and trade it at price. Doesn't commit.
+
+    The claim is a conditional UPDATE (status open -> filled), so an order
+    cancelled meanwhile, or filled by another worker, isn't traded again.
+    Returns whether the order was filled.
+    """
+
+    claimed = Order.query.filter((Order.id == order_id) & (Order.status == "open")) \
+        .update({Order.status: "filled", Order.fill_price: price, Order.filled_at: datetime.now()}, synchronize_session=False)
+    if not claimed:
+        return False
+
+    order = db.session.get(Order, order_id)
+    trade = execute_buy if order.side == "buy" else execute_sell
+    order.transaction_id = trade(order.user_id, order.symbol, order.shares, price).id
+    return True
+
+
+class MatchingEngine:
+    """Order books of all open limit and stop orders, kept in memory.
+
+    Rebuilt from the orders table on first use and topped up with orders
+    placed since (by any worker) before each matching round. Triggered
+    orders are filled at the current price through the same trade functions
+    as the buy and sell routes; a limit order fills at its price or better,
+    a stop order becomes a market order. Orders that can't be filled by then
+    (not enough cash or shares) are rejected.
+    """
+
+    # Ids are handed out before commit, so an order can become visible after
+    # ones with higher ids: each sync looks this many ids back for stragglers
+    SYNC_LOOKBACK = 1000
+
+    def __init__(self, app=None):
+        self.app = None
+        self.books = {}
+        self.synced_id = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.cli.add_command(match_orders_command)
+
+    def add(self, order):
+        with self._lock:
+            self.books.setdefault(order.symbol, OrderBook()).add(order.id, order.side, order.kind, order.price)
+
+    def remove(self, order):
+        with self._lock:
+            if order.symbol in self.books:
+                self.books[order.symbol].remove(order.id)
+
+    def sync(self):
+        """Load open orders not in the books yet (all of them the first time).
+
+        Returns the number of open orders read, including ones already in the books.
+        """
+
+        # Plain rows rather than ORM objects, there can be millions on startup
+        orders = Order.__table__
+        query = select(orders.c.id, orders.c.symbol, orders.c.side, orders.c.kind, orders.c.price) \
+            .where(orders.c.status == "open").order_by(orders.c.id)
+        if self.synced_id is not None:
+            query = query.where(orders.c.id > self.synced_id - self.SYNC_LOOKBACK)
+
+        with self.app.app_context():
+            rows = db.session.execute(query).all()
+            db.session.remove()
+
+        with self._lock:
+            # Orders already in a book are skipped by OrderBook.add
+            for order_id, symbol, side, kind, price in rows:
+                self.books.setdefault(symbol, OrderBook()).add(order_id, side, kind, price)
+            if rows or self.synced_id is None:
+                self.synced_id = max(rows[-1][0] if rows else 0, self.synced_id or 0)
+
+        return len(rows)
+
+    def symbols(self):
+        """Symbols with resting orders."""
+
+        with self._lock:
+            return [symbol for symbol, book in self.books.items() if len(book)]
+
+    def match(self, quotes):
+        """Fill the orders triggered by quotes (symbol -> quote). Returns the number filled."""
+
+        triggered = []
+        with self._lock:
+            for symbol, quote in quotes.items():
+                # Never fill at a last known price while the stock API is down
+                if quote is None or quote.get("stale") or symbol not in self.books:
+                    continue
+                triggered.extend((order_id, quote["price"]) for order_id in self.books[symbol].crossed(quote["price"]))
+
+        if not triggered:
+            return 0
+
+        filled = 0
+        with self.app.app_context():
+            for order_id, price in triggered:
+                try:
+                    filled += run_trade(fill_order, order_id, price)
+                except TradeError as e:
+                    Order.query.filter((Order.id == order_id) & (Order.status == "open")) \
+                        .update({Order.status: "rejected", Order.error: str(e)}, synchronize_session=False)
+                    db.session.commit()
+                except Exception:
+                    # Still open, reload every open order next round to retry it
+                    logger.exception("Filling order %s failed", order_id)
+                    db.session.rollback()
+                    self.synced_id = None
+            db.session.remove()
+
+        return filled
+
+    def poll(self, timeout=60):
+        """Price every symbol with resting orders and fill the triggered ones. Returns the number filled."""
+
+        self.sync()
+        symbols = self.symbols()
+        return self.match(lookup_many(symbols, timeout=timeout)) if symbols else 0
+
+
+matching_engine = MatchingEngine()
+
+
+@click.command("match-orders")
+@click.option("--interval", type=int, default=0, help="Keep matching every INTERVAL seconds.")
+def match_orders_command(interval):
+    """Fill limit and stop orders triggered at current prices.
+
+    Orders are also matched by the price refresher (PRICE_REFRESH_INTERVAL),
+    run this with --interval as a separate process otherwise.
+    """
+
+    while True:
+        started = time.time()
+        click.echo(f"Filled {matching_engine.poll(timeout=matching_engine.app.config['QUOTE_BATCH_TIMEOUT'])} orders")
+
+        if interval <= 0:
+            break
+        time.sleep(max(interval - (time.time() - started), 1))
@@ -0,0 +1,44 @@
+"""Add cost basis aggregates
+
+Revision ID: 3c1f6a2d9e47
+Revises: 7bdbf9a44982
+Create Date: 2026-10-18 10:12:41.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f6a2d9e47'
+down_revision = '7bdbf9a44982'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('holdings', sa.Column('total_cost', sa.Float(), server_default='0', nullable=False))
+    op.add_column('users', sa.Column('realized_gain', sa.Float(), server_default='0', nullable=False))
+
+    # Selling every share used to leave an empty holding behind; drop them so
+    # their net cost is counted as realized below rather than as an open position
+    op.execute("DELETE FROM holdings WHERE shares = 0")
+
+    # Backfill from existing transactions
+    op.execute(
+        "UPDATE holdings SET total_cost = COALESCE(("
+        "SELECT SUM(t.shares * t.price) FROM transactions t "
+        "WHERE t.user_id = holdings.user_id AND t.symbol = holdings.symbol), 0)"
+    )
+    op.execute(
+        "UPDATE users SET realized_gain = "
+        "COALESCE((SELECT SUM(h.total_cost) FROM holdings h WHERE h.user_id = users.id), 0) - "
+        "COALESCE((SELECT SUM(t.shares * t.price) FROM transactions t WHERE t.user_id = users.id), 0)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('realized_gain')
+    with op.batch_alter_table('holdings') as batch_op:
+        batch_op.drop_column('total_cost')
@@ -0,0 +1,47 @@
+"""Add leaderboard tables
+
+Revision ID: 5d7e1f3a9b21
+Revises: a8e2b5c07d13
+Create Date: 2026-10-18 14:05:37.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d7e1f3a9b21'
+down_revision = 'a8e2b5c07d13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('leaderboard',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=80), nullable=False),
+    sa.Column('cash', sa.Float(), nullable=False),
+    sa.Column('holdings_value', sa.Float(), nullable=False),
+    sa.Column('total_value', sa.Float(), nullable=False),
+    sa.Column('invested', sa.Float(), nullable=False),
+    sa.Column('total_return', sa.Float(), nullable=False),
+    sa.Column('value_rank', sa.Integer(), nullable=False),
+    sa.Column('return_rank', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    op.create_index('ix_leaderboard_value_rank', 'leaderboard', ['value_rank'], unique=False)
+    op.create_index('ix_leaderboard_return_rank', 'leaderboard', ['return_rank'], unique=False)
+    op.create_table('leaderboard_prices',
+    sa.Column('symbol', sa.String(length=5), nullable=False),
+    sa.Column('price', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('symbol')
+    )
+
+
+def downgrade():
+    op.drop_table('leaderboard_prices')
+    op.drop_index('ix_leaderboard_return_rank', table_name='leaderboard')
+    op.drop_index('ix_leaderboard_value_rank', table_name='leaderboard')
+    op.drop_table('leaderboard')
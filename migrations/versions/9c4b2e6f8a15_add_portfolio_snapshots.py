@@ -0,0 +1,35 @@
+"""Add portfolio snapshots
+
+Revision ID: 9c4b2e6f8a15
+Revises: 5d7e1f3a9b21
+Create Date: 2026-10-18 15:22:09.640371
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4b2e6f8a15'
+down_revision = '5d7e1f3a9b21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('portfolio_snapshots',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('cash', sa.Float(), nullable=False),
+    sa.Column('holdings_value', sa.Float(), nullable=False),
+    sa.Column('cost', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_portfolio_snapshots_user_id_date', 'portfolio_snapshots', ['user_id', 'date'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_portfolio_snapshots_user_id_date', table_name='portfolio_snapshots')
+    op.drop_table('portfolio_snapshots')
@@ -0,0 +1,45 @@
+"""Add holdings and transactions indexes
+
+Revision ID: a8e2b5c07d13
+Revises: 3c1f6a2d9e47
+Create Date: 2026-10-18 11:40:03.581270
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8e2b5c07d13'
+down_revision = '3c1f6a2d9e47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Merge any duplicate holdings (from concurrent buys) into the oldest row
+    # before enforcing one holding per stock per user. Each duplicate was
+    # already backfilled with the whole stock's cost, so take it once.
+    op.execute(
+        "UPDATE holdings SET "
+        "shares = (SELECT SUM(h.shares) FROM holdings h WHERE h.user_id = holdings.user_id AND h.symbol = holdings.symbol) "
+        "WHERE id IN (SELECT MIN(id) FROM holdings GROUP BY user_id, symbol HAVING COUNT(*) > 1)"
+    )
+    op.execute("DELETE FROM holdings WHERE id NOT IN (SELECT MIN(id) FROM holdings GROUP BY user_id, symbol)")
+
+    # Realized gain was backfilled against the duplicated costs too
+    op.execute(
+        "UPDATE users SET realized_gain = "
+        "COALESCE((SELECT SUM(h.total_cost) FROM holdings h WHERE h.user_id = users.id), 0) - "
+        "COALESCE((SELECT SUM(t.shares * t.price) FROM transactions t WHERE t.user_id = users.id), 0)"
+    )
+
+    op.create_index('ix_holdings_user_id_symbol', 'holdings', ['user_id', 'symbol'], unique=True)
+    op.create_index('ix_transactions_user_id_symbol', 'transactions', ['user_id', 'symbol'], unique=False)
+    op.create_index('ix_transactions_user_id_timestamp', 'transactions', ['user_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_transactions_user_id_timestamp', table_name='transactions')
+    op.drop_index('ix_transactions_user_id_symbol', table_name='transactions')
+    op.drop_index('ix_holdings_user_id_symbol', table_name='holdings')
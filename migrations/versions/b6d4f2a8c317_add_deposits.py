@@ -0,0 +1,33 @@
+"""Add deposits
+
+Revision ID: b6d4f2a8c317
+Revises: e3a7c9d1f604
+Create Date: 2026-10-18 19:12:40.527613
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d4f2a8c317'
+down_revision = 'e3a7c9d1f604'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('deposits',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_deposits_user_id_timestamp', 'deposits', ['user_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_deposits_user_id_timestamp', table_name='deposits')
+    op.drop_table('deposits')
@@ -0,0 +1,45 @@
+"""Add orders
+
+Revision ID: e3a7c9d1f604
+Revises: 9c4b2e6f8a15
+Create Date: 2026-10-18 16:41:52.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a7c9d1f604'
+down_revision = '9c4b2e6f8a15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('orders',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('symbol', sa.String(length=5), nullable=False),
+    sa.Column('side', sa.String(length=4), nullable=False),
+    sa.Column('kind', sa.String(length=5), nullable=False),
+    sa.Column('shares', sa.Integer(), nullable=False),
+    sa.Column('price', sa.Float(), nullable=False),
+    sa.Column('status', sa.String(length=9), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('filled_at', sa.DateTime(), nullable=True),
+    sa.Column('fill_price', sa.Float(), nullable=True),
+    sa.Column('transaction_id', sa.Integer(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.ForeignKeyConstraint(['transaction_id'], ['transactions.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_orders_status_id', 'orders', ['status', 'id'], unique=False)
+    op.create_index('ix_orders_user_id_created_at', 'orders', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_orders_user_id_created_at', table_name='orders')
+    op.drop_index('ix_orders_status_id', table_name='orders')
+    op.drop_table('orders')
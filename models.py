@@ -1,6 +1,7 @@
 from app import db
 from flask_login import UserMixin
 from datetime import datetime
+from sqlalchemy import func
 
 # Models used to translate into database schema using Flask-SQLAlchemy (ORM)
 # User has many Holdings, and User has many Transactions (One-to-Many relationships)
@@ -14,6 +15,8 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String, nullable=False)
     cash = db.Column(db.Float, nullable=False, default=10000.00)
+    # Net gain from trades in stocks no longer held (kept in step with trades)
+    realized_gain = db.Column(db.Float, nullable=False, default=0, server_default="0")
     holdings = db.relationship("Holding", backref="user", lazy=True)
     transactions = db.relationship("Transaction", backref="user", lazy=True)
 
@@ -23,10 +26,14 @@ class User(UserMixin, db.Model):
 
 class Holding(db.Model):
     __tablename__ = "holdings"
+    # One row per stock per user, also used for buy/sell/quote lookups
+    __table_args__ = (db.Index("ix_holdings_user_id_symbol", "user_id", "symbol", unique=True),)
 
     id = db.Column(db.Integer, primary_key=True)
     symbol = db.Column(db.String(5), nullable=False)
     shares = db.Column(db.Integer, nullable=False)
+    # Net cost of all the user's transactions in this stock (kept in step with trades)
+    total_cost = db.Column(db.Float, nullable=False, default=0, server_default="0")
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable="False")
 
     def __repr__(self):
@@ -34,6 +41,11 @@ class Holding(db.Model):
 
 class Transaction(db.Model):
     __tablename__ = "transactions"
+    # Per-stock cost sums and per-user history ordered by time
+    __table_args__ = (
+        db.Index("ix_transactions_user_id_symbol", "user_id", "symbol"),
+        db.Index("ix_transactions_user_id_timestamp", "user_id", "timestamp"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     symbol = db.Column(db.String(5), nullable=False)
@@ -44,3 +56,104 @@ class Transaction(db.Model):
 
     def __repr__(self):
         return "<Transaction %r>" % self.timestamp
+
+    @staticmethod
+    def cost_by_symbol(user_id, symbol=None):
+        """Net cost (sum of shares * price) of a user's transactions per symbol, in one grouped query.
+
+        Sold shares are negative, so sales reduce the cost.
+        """
+        query = db.session.query(Transaction.symbol, func.sum(Transaction.shares * Transaction.price)) \
+            .filter(Transaction.user_id == user_id)
+        if symbol is not None:
+            query = query.filter(Transaction.symbol == symbol)
+        return dict(query.group_by(Transaction.symbol).all())
+
+class Deposit(db.Model):
+    __tablename__ = "deposits"
+    # Cash added to an account after it was opened (read per user for analytics)
+    __table_args__ = (db.Index("ix_deposits_user_id_timestamp", "user_id", "timestamp"),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    def __repr__(self):
+        return "<Deposit %r>" % self.id
+
+class LeaderboardEntry(db.Model):
+    __tablename__ = "leaderboard"
+    # Materialized by the update-leaderboard job, read a page at a time by rank
+    __table_args__ = (
+        db.Index("ix_leaderboard_value_rank", "value_rank"),
+        db.Index("ix_leaderboard_return_rank", "return_rank"),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), primary_key=True)
+    username = db.Column(db.String(80), nullable=False)
+    cash = db.Column(db.Float, nullable=False)
+    holdings_value = db.Column(db.Float, nullable=False)
+    total_value = db.Column(db.Float, nullable=False)
+    # Starting cash (cash plus the net cost of all trades)
+    invested = db.Column(db.Float, nullable=False)
+    total_return = db.Column(db.Float, nullable=False)
+    value_rank = db.Column(db.Integer, nullable=False)
+    return_rank = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return "<LeaderboardEntry %r>" % self.username
+
+class LeaderboardPrice(db.Model):
+    __tablename__ = "leaderboard_prices"
+    # Price of each held stock used for the current leaderboard
+
+    symbol = db.Column(db.String(5), primary_key=True)
+    price = db.Column(db.Float, nullable=False)
+
+class PortfolioSnapshot(db.Model):
+    __tablename__ = "portfolio_snapshots"
+    # One row per user per day, read by date range for charts
+    __table_args__ = (db.Index("ix_portfolio_snapshots_user_id_date", "user_id", "date", unique=True),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    cash = db.Column(db.Float, nullable=False)
+    holdings_value = db.Column(db.Float, nullable=False)
+    # Net cost of all trades so far (as on the portfolio page)
+    cost = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return "<PortfolioSnapshot %r %r>" % (self.user_id, self.date)
+
+class Order(db.Model):
+    __tablename__ = "orders"
+    # Open orders are loaded into the matching engine by id, users list theirs newest first
+    __table_args__ = (
+        db.Index("ix_orders_status_id", "status", "id"),
+        db.Index("ix_orders_user_id_created_at", "user_id", "created_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    symbol = db.Column(db.String(5), nullable=False)
+    # "buy" or "sell"
+    side = db.Column(db.String(4), nullable=False)
+    # "limit" or "stop"
+    kind = db.Column(db.String(5), nullable=False)
+    shares = db.Column(db.Integer, nullable=False)
+    # Limit or stop price
+    price = db.Column(db.Float, nullable=False)
+    # "open", "filled", "cancelled" or "rejected"
+    status = db.Column(db.String(9), nullable=False, default="open")
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    filled_at = db.Column(db.DateTime)
+    fill_price = db.Column(db.Float)
+    transaction_id = db.Column(db.Integer, db.ForeignKey("transactions.id"))
+    # Why a triggered order couldn't be filled
+    error = db.Column(db.String)
+
+    def __repr__(self):
+        return "<Order %r>" % self.id
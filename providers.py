@@ -0,0 +1,306 @@
+import abc
+import csv
+import os
+import time
+import urllib.parse
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+import pytz
+import requests
+
+
+class ProviderError(Exception):
+    """Market data source is failing (as opposed to not knowing a symbol)."""
+
+
+# One day of prices (close is adjusted for splits and dividends where the source provides it)
+Bar = namedtuple("Bar", ["date", "open", "high", "low", "close", "volume"])
+
+
+class Provider(abc.ABC):
+    """Source of stock prices.
+
+    quote returns a quote dict (name, price, symbol, change, change_percent)
+    or None for unknown symbols, and raises ProviderError when the source
+    itself is failing. history returns a list of daily Bars, oldest first,
+    or None for unknown symbols. Providers that set batch can price many symbols
+    in one request.
+    """
+
+    name = None
+    batch = False
+    # Quotes are just the last two daily closes, so they can be built from stored history
+    quotes_from_history = False
+    # Local providers answer from their own files, no need to keep their bars in the bar store
+    remote = True
+
+    @abc.abstractmethod
+    def quote(self, symbol):
+        """Quote for symbol, or None if unknown."""
+
+    def quotes(self, symbols):
+        """Quotes for several symbols as a dict of symbol -> quote (or None)."""
+        return {symbol: self.quote(symbol) for symbol in symbols}
+
+    @abc.abstractmethod
+    def history(self, symbol, days=7):
+        """Daily Bars of symbol over the last days, or None if unknown."""
+
+
+def quote_from_closes(symbol, closes, name=None):
+    """Build a quote from the last two daily closes."""
+
+    if len(closes) < 2:
+        return None
+
+    oldPr = float(closes[-2])
+    closePr = float(closes[-1])
+
+    return {
+        "name": name or symbol,
+        "price": round(closePr, 2),
+        "symbol": symbol,
+        "change": round(closePr - oldPr, 2),
+        "change_percent": round(((closePr - oldPr) / oldPr) * 100, 2)
+    }
+
+
+class YahooProvider(Provider):
+    """Yahoo Finance CSV download API (quotes are built from the last two closes)."""
+
+    name = "yahoo"
+    quotes_from_history = True
+
+    def __init__(self, client, url="https://query1.finance.yahoo.com"):
+        self.client = client
+        self.url = url.rstrip("/")
+
+    def get(self, url):
+        try:
+            response = self.client.get(url)
+        except requests.RequestException as e:
+            raise ProviderError(str(e)) from e
+
+        # Throttling and server errors mean the API is failing, 404s are unknown symbols
+        if response.status_code == 429 or response.status_code >= 500:
+            raise ProviderError(f"{self.name} API returned {response.status_code}")
+        return response
+
+    def quote(self, symbol):
+        # A weekend or holiday can leave fewer than two trading days in a shorter window
+        bars = self.history(symbol, days=7)
+        return quote_from_closes(symbol, [bar.close for bar in bars]) if bars else None
+
+    def history(self, symbol, days=7):
+        end = datetime.now(pytz.timezone("US/Eastern"))
+        start = end - timedelta(days=days)
+
+        url = (
+            f"{self.url}/v7/finance/download/{urllib.parse.quote_plus(symbol)}"
+            f"?period1={int(start.timestamp())}"
+            f"&period2={int(end.timestamp())}"
+            f"&interval=1d&events=history&includeAdjustedClose=true"
+        )
+        response = self.get(url)
+
+        try:
+            response.raise_for_status()
+
+            # CSV header: Date,Open,High,Low,Close,Adj Close,Volume
+            rows = csv.DictReader(response.content.decode("utf-8").splitlines())
+            return [
+                Bar(date.fromisoformat(row["Date"]), float(row["Open"]), float(row["High"]), float(row["Low"]),
+                    float(row["Adj Close"]), float(row["Volume"]))
+                for row in rows
+            ]
+        except (requests.RequestException, ValueError, KeyError):
+            return None
+
+
+class IEXProvider(YahooProvider):
+    """IEX Cloud API (needs IEX_API_KEY, supports batch quotes)."""
+
+    name = "iex"
+    batch = True
+    # Live latestPrice and company name, not the last daily close
+    quotes_from_history = False
+    # Most symbols IEX accepts in one batch request
+    BATCH_SIZE = 100
+
+    # Smallest chart range covering the requested number of days
+    RANGES = ((5, "5d"), (30, "1m"), (90, "3m"), (180, "6m"), (365, "1y"), (730, "2y"), (1825, "5y"))
+
+    def __init__(self, client, url="https://cloud.iexapis.com", api_key=None):
+        super().__init__(client, url)
+        self.api_key = api_key
+
+    @staticmethod
+    def parse(quote):
+        return {
+            "name": quote["companyName"],
+            "price": float(quote["latestPrice"]),
+            "symbol": quote["symbol"],
+            "change": float(quote["change"]),
+            # IEX gives a fraction, the app shows percent
+            "change_percent": round(float(quote["changePercent"]) * 100, 2)
+        }
+
+    def quote(self, symbol):
+        response = self.get(f"{self.url}/stable/stock/{urllib.parse.quote_plus(symbol)}/quote?token={self.api_key}")
+
+        try:
+            response.raise_for_status()
+            return self.parse(response.json())
+        except (requests.RequestException, KeyError, TypeError, ValueError):
+            return None
+
+    def quotes(self, symbols):
+        symbols = list(symbols)
+        quotes = {}
+        for start in range(0, len(symbols), self.BATCH_SIZE):
+            quotes.update(self.batch_quotes(symbols[start:start + self.BATCH_SIZE]))
+        return quotes
+
+    def batch_quotes(self, symbols):
+        """Quotes for up to BATCH_SIZE symbols in one request."""
+
+        query = urllib.parse.quote(",".join(symbols), safe=",")
+        response = self.get(f"{self.url}/stable/stock/market/batch?symbols={query}&types=quote&token={self.api_key}")
+
+        try:
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError):
+            return {symbol: None for symbol in symbols}
+
+        quotes = {}
+        for symbol in symbols:
+            try:
+                quotes[symbol] = self.parse(data[symbol]["quote"])
+            except (KeyError, TypeError, ValueError):
+                quotes[symbol] = None
+        return quotes
+
+    def history(self, symbol, days=7):
+        chart_range = next((name for limit, name in self.RANGES if days <= limit), "max")
+        response = self.get(
+            f"{self.url}/stable/stock/{urllib.parse.quote_plus(symbol)}/chart/{chart_range}"
+            f"?token={self.api_key}"
+        )
+
+        try:
+            response.raise_for_status()
+            since = date.today() - timedelta(days=days)
+            return [
+                Bar(date.fromisoformat(bar["date"]), float(bar["open"]), float(bar["high"]), float(bar["low"]),
+                    float(bar["close"]), float(bar["volume"]))
+                for bar in response.json()
+                if date.fromisoformat(bar["date"]) > since
+            ]
+        except (requests.RequestException, KeyError, TypeError, ValueError):
+            return None
+
+
+class ReplayProvider(Provider):
+    """Serve prices from a local CSV or Parquet file, without any network.
+
+    The file has Symbol, Date and Close columns (one row per symbol and day),
+    and optionally Open, High, Low and Volume.
+    Prices are those of the latest day, or with REPLAY_INTERVAL set, the
+    days are played back in order, one every REPLAY_INTERVAL seconds
+    (starting over after the last one).
+    """
+
+    name = "replay"
+    batch = True
+    quotes_from_history = True
+    remote = False
+
+    def __init__(self, path, interval=0):
+        self.path = path
+        self.interval = interval
+        self.started = time.monotonic()
+        self.bars = {}
+
+        # Every symbol repeats the same dates, parse each once
+        days = {}
+
+        for row in self.read(path):
+            symbol = str(row["Symbol"]).upper()
+            day = days.get(row["Date"])
+            if day is None:
+                day = days[row["Date"]] = row["Date"] if isinstance(row["Date"], date) else date.fromisoformat(str(row["Date"])[:10])
+            close = float(row["Close"])
+            bar = Bar(day, float(row.get("Open") or close), float(row.get("High") or close), float(row.get("Low") or close),
+                      close, float(row.get("Volume") or 0))
+            self.bars.setdefault(symbol, []).append(bar)
+
+        for bars in self.bars.values():
+            bars.sort()
+        self.days = sorted(set(bar.date for bars in self.bars.values() for bar in bars))
+
+    @staticmethod
+    def read(path):
+        if not path or not os.path.exists(path):
+            raise RuntimeError(f"REPLAY_DATA_PATH not found: {path}")
+
+        if path.endswith(".parquet"):
+            try:
+                import pyarrow.parquet
+            except ImportError:
+                raise RuntimeError("REPLAY_DATA_PATH is a Parquet file but the pyarrow package is not installed")
+            return pyarrow.parquet.read_table(path).to_pylist()
+
+        # Plain reader zipped with the header, DictReader is several times slower on large files
+        with open(path, newline="") as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            return [dict(zip(header, row)) for row in reader]
+
+    def today(self):
+        """Day currently being replayed."""
+
+        if not self.interval:
+            return self.days[-1]
+        # Start from the second day, so there's a previous close to compare with
+        days = self.days[1:] or self.days
+        step = int((time.monotonic() - self.started) / self.interval)
+        return days[step % len(days)]
+
+    def bars_until(self, symbol, day, days):
+        """Bars of symbol in the days up to and including day."""
+
+        bars = self.bars.get(symbol.upper(), [])
+        end = bisect_right(bars, (day, float("inf")))
+        start = bisect_right(bars, (day - timedelta(days=days), float("inf")), 0, end)
+        return bars[start:end]
+
+    def quote(self, symbol):
+        return self.quotes([symbol])[symbol]
+
+    def quotes(self, symbols):
+        day = self.today()
+        # Last two closes, like the Yahoo provider's 7 day window
+        return {symbol: quote_from_closes(symbol, [bar.close for bar in self.bars_until(symbol, day, 7)]) for symbol in symbols}
+
+    def history(self, symbol, days=7):
+        return self.bars_until(symbol, self.today(), days) or None
+
+
+def make_provider(config, client):
+    """Build the market data provider named by MARKET_DATA_PROVIDER."""
+
+    kind = config.get("MARKET_DATA_PROVIDER", "yahoo")
+
+    if kind == "yahoo":
+        return YahooProvider(client, config.get("YAHOO_API_URL", "https://query1.finance.yahoo.com"))
+
+    if kind == "iex":
+        return IEXProvider(client, config.get("IEX_API_URL", "https://cloud.iexapis.com"), config.get("IEX_API_KEY"))
+
+    if kind == "replay":
+        return ReplayProvider(config.get("REPLAY_DATA_PATH"), config.get("REPLAY_INTERVAL", 0))
+
+    raise RuntimeError(f"Unknown MARKET_DATA_PROVIDER: {kind}")
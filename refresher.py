@@ -0,0 +1,139 @@
+import logging
+import os
+import threading
+import time
+
+import click
+
+from cache import price_snapshot
+from helpers import QuoteUnavailable, fetch_quote, fetch_quotes, market_data
+
+logger = logging.getLogger(__name__)
+
+
+class PriceRefresher:
+    """Background thread keeping the price snapshot current.
+
+    Refreshes every symbol held in a portfolio or with resting orders plus
+    recently quoted symbols once per PRICE_REFRESH_INTERVAL, so pages can be
+    priced without waiting on the stock API, and fills the orders the new
+    prices trigger. Symbols another worker refreshed within the interval
+    (when the snapshot is shared) are skipped, so upstream cost follows the
+    refresh rate rather than traffic.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get("PRICE_REFRESH_INTERVAL", 0)
+        price_snapshot.init_app(app)
+        app.cli.add_command(refresh_prices_command)
+
+        # Start lazily from the first request, so CLI commands (like migrations)
+        # and the Gunicorn master don't spin up a refresher
+        if self.interval > 0:
+            app.before_request(self.start)
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self.run, name="price-refresher", daemon=True).start()
+
+    def run(self):
+        while True:
+            started = time.time()
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Price refresh failed")
+            time.sleep(max(self.interval - (time.time() - started), 1))
+
+    def symbols(self):
+        """Symbols to keep current: everything held, with resting orders or recently quoted."""
+
+        from app import db
+        from matching import matching_engine
+        from models import Holding
+
+        with self.app.app_context():
+            held = [symbol for (symbol,) in db.session.query(Holding.symbol).distinct()]
+            db.session.remove()
+
+        # Picks up orders placed since the last round
+        matching_engine.sync()
+
+        return set(symbol.upper() for symbol in held) | set(matching_engine.symbols()) | set(price_snapshot.recent())
+
+    def refresh(self, force=False):
+        """Fetch quotes for all due symbols concurrently and store them in the snapshot.
+
+        Returns the number of symbols refreshed.
+        """
+
+        due = []
+        for symbol in self.symbols():
+            age = price_snapshot.age(symbol)
+            if force or age is None or age >= self.interval:
+                due.append(symbol)
+
+        if not due:
+            return 0
+
+        # Batch providers price every due symbol in one request
+        if market_data.provider.batch:
+            try:
+                quotes = fetch_quotes(due)
+            except QuoteUnavailable:
+                quotes = {}
+        else:
+            futures = {symbol: market_data.executor.submit(fetch_quote, symbol) for symbol in due}
+            quotes = {}
+            for symbol, future in futures.items():
+                try:
+                    quotes[symbol] = future.result()
+                except QuoteUnavailable:
+                    pass
+
+        refreshed = 0
+        for symbol, quote in quotes.items():
+            if quote is not None:
+                price_snapshot.set(symbol, quote)
+                refreshed += 1
+
+        # Fill limit and stop orders the new prices trigger
+        from matching import matching_engine
+        matching_engine.match(quotes)
+
+        return refreshed
+
+
+price_refresher = PriceRefresher()
+
+
+@click.command("refresh-prices")
+@click.option("--interval", type=int, default=0, help="Keep refreshing every INTERVAL seconds.")
+def refresh_prices_command(interval):
+    """Refresh the price snapshot for held and recently quoted symbols.
+
+    Run with --interval as a separate process to refresh a shared snapshot
+    for all workers (set PRICE_SNAPSHOT_MAX_AGE on the web workers).
+    """
+
+    if interval > 0:
+        price_refresher.interval = interval
+        price_snapshot.max_age = price_snapshot.max_age or interval * 2
+        price_refresher.run()
+    else:
+        click.echo(f"Refreshed {price_refresher.refresh(force=True)} symbols")
@@ -0,0 +1,71 @@
+import csv
+import io
+from datetime import date
+
+from app import db
+from helpers import lookup_many
+from models import User, Holding, PortfolioSnapshot
+
+# End of day snapshots of every user's portfolio (flask snapshot-portfolios),
+# so charts and past gains read one row per day instead of replaying trades
+# against historical prices.
+
+BATCH_SIZE = 5000
+
+
+def take_snapshots(day=None, timeout=60):
+    """Write the day's snapshot row for every user (replacing any earlier one). Returns the rows written."""
+
+    day = day or date.today()
+
+    # Price every distinct held stock once
+    symbols = [symbol for (symbol,) in db.session.query(Holding.symbol).distinct()]
+    quotes = lookup_many(symbols, timeout=timeout)
+
+    # Value and cost of each user's holdings (stocks that couldn't be priced count at cost,
+    # as do last known prices while the stock API is down, which could be days old)
+    values = {}
+    costs = {}
+    holdings = db.session.query(Holding.user_id, Holding.symbol, Holding.shares, Holding.total_cost).yield_per(BATCH_SIZE)
+    for user_id, symbol, shares, total_cost in holdings:
+        quote = quotes.get(symbol.upper())
+        priced = quote is not None and not quote.get("stale")
+        values[user_id] = values.get(user_id, 0) + (shares * quote["price"] if priced else total_cost)
+        costs[user_id] = costs.get(user_id, 0) + total_cost
+
+    # One row per user, cost includes stocks no longer held (as on the portfolio page)
+    rows = [
+        {
+            "user_id": user_id,
+            "date": day,
+            "cash": cash,
+            "holdings_value": values.get(user_id, 0),
+            "cost": costs.get(user_id, 0) - realized_gain,
+        }
+        for user_id, cash, realized_gain in db.session.query(User.id, User.cash, User.realized_gain).yield_per(BATCH_SIZE)
+    ]
+
+    PortfolioSnapshot.query.filter(PortfolioSnapshot.date == day).delete(synchronize_session=False)
+    insert_snapshots(rows)
+    db.session.commit()
+
+    return len(rows)
+
+
+def insert_snapshots(rows):
+    """Bulk insert snapshot rows: COPY on PostgreSQL, batched executemany elsewhere."""
+
+    if db.session.get_bind().dialect.name == "postgresql":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row["user_id"], row["date"].isoformat(), row["cash"], row["holdings_value"], row["cost"]])
+        buffer.seek(0)
+
+        # Same connection (and transaction) as the session
+        cursor = db.session.connection().connection.cursor()
+        cursor.copy_expert("COPY portfolio_snapshots (user_id, date, cash, holdings_value, cost) FROM STDIN WITH (FORMAT csv)", buffer)
+        return
+
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(PortfolioSnapshot.__table__.insert(), rows[start:start + BATCH_SIZE])
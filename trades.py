@@ -0,0 +1,171 @@
+import random
+import time
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app import db
+from models import User, Holding, Transaction
+
+# Trade execution shared by the buy/sell routes. Balances and share counts are
+# changed with conditional UPDATEs (UPDATE ... WHERE cash >= :cost), so the
+# check and the change happen atomically in the database and concurrent orders
+# from the same account can't both spend the same cash or shares.
+
+
+class TradeError(Exception):
+    """Trade rejected by a business rule (message is shown to the user)."""
+
+
+def execute_buy(user_id, symbol, shares, price):
+    """Buy shares of symbol at price for user. Doesn't commit."""
+
+    cost = price * shares
+
+    # Deduct cash only if the user still has enough
+    updated = User.query.filter((User.id == user_id) & (User.cash >= cost)) \
+        .update({User.cash: User.cash - cost}, synchronize_session=False)
+    if not updated:
+        raise TradeError("Not enough cash to complete purchase")
+
+    # Add to the holding if already owned
+    updated = Holding.query.filter((Holding.user_id == user_id) & (Holding.symbol == symbol)) \
+        .update({Holding.shares: Holding.shares + shares, Holding.total_cost: Holding.total_cost + cost}, synchronize_session=False)
+
+    # Otherwise open a new holding, carrying over the net cost of earlier trades in the stock
+    # (a concurrent buy inserting the same holding fails the unique index and is retried)
+    if not updated:
+        prior_cost = Transaction.cost_by_symbol(user_id, symbol).get(symbol, 0)
+        if prior_cost:
+            User.query.filter(User.id == user_id) \
+                .update({User.realized_gain: User.realized_gain + prior_cost}, synchronize_session=False)
+        db.session.add(Holding(user_id=user_id, symbol=symbol, shares=shares, total_cost=prior_cost + cost))
+
+    transaction = Transaction(user_id=user_id, symbol=symbol, shares=shares, price=price, timestamp=datetime.now())
+    db.session.add(transaction)
+    db.session.flush()
+    return transaction
+
+
+def execute_sell(user_id, symbol, shares, price):
+    """Sell shares of symbol at price for user. Doesn't commit."""
+
+    proceeds = price * shares
+
+    # Take the shares only if the user still owns enough
+    updated = Holding.query.filter((Holding.user_id == user_id) & (Holding.symbol == symbol) & (Holding.shares >= shares)) \
+        .update({Holding.shares: Holding.shares - shares, Holding.total_cost: Holding.total_cost - proceeds}, synchronize_session=False)
+    if not updated:
+        if Holding.query.filter((Holding.user_id == user_id) & (Holding.symbol == symbol)).first() is None:
+            raise TradeError("You do not own shares in this company")
+        raise TradeError("You do not own that many shares to sell")
+
+    # Row is locked by the update above until commit
+    remaining, total_cost = db.session.query(Holding.shares, Holding.total_cost) \
+        .filter((Holding.user_id == user_id) & (Holding.symbol == symbol)).one()
+
+    # If sold all shares, delete from holdings and realize its gain
+    changes = {User.cash: User.cash + proceeds}
+    if remaining == 0:
+        Holding.query.filter((Holding.user_id == user_id) & (Holding.symbol == symbol)).delete(synchronize_session=False)
+        changes[User.realized_gain] = User.realized_gain - total_cost
+
+    User.query.filter(User.id == user_id).update(changes, synchronize_session=False)
+
+    transaction = Transaction(user_id=user_id, symbol=symbol, shares=-shares, price=price, timestamp=datetime.now())
+    db.session.add(transaction)
+    db.session.flush()
+    return transaction
+
+
+def run_trade(trade, *args, retries=5, backoff=0.05):
+    """Run trade(*args) and commit, retrying on conflicts with concurrent trades.
+
+    Lock timeouts, deadlocks and unique index violations roll back and retry
+    with jittered exponential backoff. TradeError is never retried.
+    """
+
+    for attempt in range(retries + 1):
+        try:
+            result = trade(*args)
+            db.session.commit()
+            return result
+        except TradeError:
+            db.session.rollback()
+            raise
+        except (IntegrityError, OperationalError):
+            db.session.rollback()
+            if attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt) * random.random())
+
+
+def trade_error(side, amount, cash, owned, shares):
+    """Check one trade against cash and shares owned (None if not held), without touching the database.
+
+    Same rules as execute_buy and execute_sell. Returns the error message, or None if allowed.
+    """
+
+    if side == "buy":
+        if amount > cash:
+            return "Not enough cash to complete purchase"
+    elif not owned:
+        return "You do not own shares in this company"
+    elif owned < shares:
+        return "You do not own that many shares to sell"
+    return None
+
+
+def validate_basket(cash, holdings, legs):
+    """Check basket legs in order against cash and holdings, without touching the database.
+
+    holdings maps symbol -> shares owned. Each leg is a dict with side, symbol,
+    shares and price. Returns a list with an error message (or None) per leg;
+    rejected legs don't count towards later ones.
+    """
+
+    holdings = dict(holdings)
+    errors = []
+
+    for leg in legs:
+        amount = leg["price"] * leg["shares"]
+
+        error = trade_error(leg["side"], amount, cash, holdings.get(leg["symbol"]), leg["shares"])
+        errors.append(error)
+        if error:
+            continue
+
+        if leg["side"] == "buy":
+            cash -= amount
+            holdings[leg["symbol"]] = holdings.get(leg["symbol"], 0) + leg["shares"]
+        else:
+            cash += amount
+            holdings[leg["symbol"]] -= leg["shares"]
+
+    return errors
+
+
+def execute_basket(user_id, legs, best_effort=False):
+    """Execute basket legs in one database transaction. Doesn't commit.
+
+    All or nothing by default: the first rejected leg raises TradeError.
+    With best_effort, rejected legs are skipped. execute_buy and execute_sell
+    only reject at their first (conditional) UPDATE, before writing anything,
+    so a skipped leg leaves nothing behind to roll back.
+    Returns an error message (or None) per leg.
+    """
+
+    errors = []
+
+    for leg in legs:
+        trade = execute_buy if leg["side"] == "buy" else execute_sell
+
+        try:
+            trade(user_id, leg["symbol"], leg["shares"], leg["price"])
+            errors.append(None)
+        except TradeError as e:
+            if not best_effort:
+                raise
+            errors.append(str(e))
+
+    return errors